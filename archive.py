@@ -0,0 +1,103 @@
+# Imports
+import struct
+import time
+
+# A stored guess in an archived game: valid_word_id (uint16) and its feedback
+# code (uint8, 255 for guesses stored before feedback was)
+GUESS = struct.Struct("<HB")
+NO_FEEDBACK = 255
+
+DAY = 24 * 60 * 60
+
+
+# (guess_number, valid_word_id, feedback) rows, in order, as one blob. Guess
+# numbers run from 1, so they are not stored.
+def pack_guesses(rows):
+    return b"".join(
+        GUESS.pack(valid_word_id, NO_FEEDBACK if pattern is None else pattern)
+        for _, valid_word_id, pattern in rows
+    )
+
+
+# The rows back from pack_guesses(), as guess_rows() reads them from guesses
+def unpack_guesses(blob):
+    return [
+        (number, valid_word_id, None if pattern == NO_FEEDBACK else pattern)
+        for number, (valid_word_id, pattern) in enumerate(GUESS.iter_unpack(blob), 1)
+    ]
+
+
+# Finished games that ended before `before` (Unix seconds), up to `batch` of
+# them after game_id `after`. Games finished before finished_at was recorded
+# have none and always qualify. The newest game is never taken: games has no
+# AUTOINCREMENT, so deleting it would let the next game reuse its game_id.
+def finished_games(connection, before, after, batch):
+    return connection.execute(
+        """
+        SELECT
+            game_id, uuid, username, secret_word_id, state, guess_remaining,
+            finished_at, finish_position
+        FROM games
+        WHERE game_id > :after AND state != 0
+        AND (finished_at IS NULL OR finished_at < :before)
+        AND game_id < (SELECT max(game_id) FROM games)
+        ORDER BY game_id
+        LIMIT :batch
+        """,
+        {"after": after, "before": before, "batch": batch},
+    ).fetchall()
+
+
+# Move one batch of games (and their guesses) into archived_games, in the
+# caller's transaction. Returns how many moved and the last game_id looked at.
+def archive_batch(connection, before, after, batch):
+    games = finished_games(connection, before, after, batch)
+    if not games:
+        return 0, after
+    first, last = games[0][0], games[-1][0]
+    guesses = {}
+    for game_id, number, valid_word_id, pattern in connection.execute(
+        """
+        SELECT game_id, guess_number, valid_word_id, feedback FROM guesses
+        WHERE game_id BETWEEN :first AND :last
+        ORDER BY game_id, guess_number
+        """,
+        {"first": first, "last": last},
+    ):
+        guesses.setdefault(game_id, []).append((number, valid_word_id, pattern))
+
+    connection.executemany(
+        """
+        INSERT INTO archived_games(
+            game_id, uuid, username, secret_word_id, state, guess_remaining,
+            finished_at, finish_position, guesses
+        )
+        VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        (tuple(game) + (pack_guesses(guesses.get(game[0], ())),) for game in games),
+    )
+    ids = [(game[0],) for game in games]
+    connection.executemany("DELETE FROM guesses WHERE game_id = ?", ids)
+    connection.executemany("DELETE FROM games WHERE game_id = ?", ids)
+    return len(games), last
+
+
+# Archive every game finished more than `days` days ago, one transaction per
+# batch so the game service is never locked out for long. Returns how many
+# games were moved.
+def archive_games(connection, days, batch=1000, now=None):
+    before = (now if now is not None else time.time()) - days * DAY
+    moved, after = 0, 0
+    while True:
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            count, after = archive_batch(connection, before, after, batch)
+            connection.execute("COMMIT")
+        except BaseException:
+            # Also after a failed COMMIT, so the write lock is not kept
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+            raise
+        if not count:
+            return moved
+        moved += count
@@ -0,0 +1,154 @@
+# Archive the finished games of a generated game.db with bin/archive_games.py
+# and compare it with the original: the size of each table and index, how
+# long listing a user's games in progress takes (the scan on
+# games_idx_usernamestate), and reading a game through GET /games/<id>. Checks
+# that every archived game, the game lists and the statistics (also rebuilt
+# from scratch) answer exactly as before, and that every archived game's
+# packed guesses unpack to the rows it had in guesses.
+#
+#   python3 -m bench.archive [--users 20000] [--lookups 2000]
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import uuid
+
+import numpy as np
+
+import archive
+import game
+from bench.common import basic_auth, configure_game
+from bench.layout import sizes
+
+sys.path.append("./bin")
+import archive_games
+import generate_data
+import rebuild_stats
+
+
+def generate(users):
+    path = os.path.join(tempfile.mkdtemp(prefix="wordle-bench-"), "game.db")
+    con = sqlite3.connect(path, isolation_level=None)
+    con.execute("PRAGMA synchronous = OFF")
+    args = argparse.Namespace(
+        users=users, games_per_user=20.0, in_progress=0.05, win_rate=0.85, chunk=50000, redis=False
+    )
+    generate_data.generate_games(con.cursor(), args, np.random.default_rng(449))
+    con.execute("VACUUM")
+    con.close()
+    return path
+
+
+# Microseconds per listing of a user's games in progress
+def list_latency(path, usernames):
+    con = sqlite3.connect(path)
+    con.row_factory = sqlite3.Row
+    start = time.perf_counter()
+    for username in usernames:
+        game.list_games(con, username, (0,), (0, 0), 100)
+    elapsed = time.perf_counter() - start
+    con.close()
+    return elapsed / len(usernames) * 1e6
+
+
+# Every archived game's unpacked guesses against its rows in the original
+def check_guesses(hot, archived):
+    con = sqlite3.connect(hot)
+    expected = {}
+    for game_id, number, valid_word_id, pattern in con.execute(
+        "SELECT game_id, guess_number, valid_word_id, feedback FROM guesses"
+    ):
+        expected.setdefault(game_id, []).append((number, valid_word_id, pattern))
+    con.close()
+    con = sqlite3.connect(archived)
+    count = 0
+    for game_id, blob in con.execute("SELECT game_id, guesses FROM archived_games"):
+        assert archive.unpack_guesses(blob) == sorted(expected.get(game_id, [])), game_id
+        count += 1
+    con.close()
+    return count
+
+
+def user_stats(path):
+    con = sqlite3.connect(path)
+    rows = con.execute("SELECT * FROM user_stats ORDER BY username").fetchall()
+    con.close()
+    return rows
+
+
+# GET /games/<id> for each game, a page of each user's games (every state)
+# and their statistics; returns the responses and the mean ms per game read
+async def responses(path, games):
+    configure_game(game.app, path)
+    results, elapsed = [], 0.0
+    async with game.app.test_app() as test_app:
+        client = test_app.test_client()
+        for username, game_uuid in games:
+            headers = basic_auth(username, "bench")
+            start = time.perf_counter()
+            response = await client.get(f"/games/{uuid.UUID(bytes=game_uuid)}", headers=headers)
+            elapsed += time.perf_counter() - start
+            results.append((response.status_code, await response.get_json()))
+            for url in ["/games?state=all&limit=1000", "/games/statistics"]:
+                response = await client.get(url, headers=headers)
+                results.append((response.status_code, await response.get_json()))
+    return results, elapsed / len(games) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark archiving finished games")
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--lookups", type=int, default=2000)
+    args = parser.parse_args()
+    random.seed(449)
+
+    hot = generate(args.users)
+    archived = os.path.join(os.path.dirname(hot), "game-archived.db")
+    shutil.copyfile(hot, archived)
+    con = sqlite3.connect(archived, isolation_level=None)
+    archive_games.prepare(con.cursor())
+    start = time.perf_counter()
+    moved = archive.archive_games(con, 0, game.app.config["ARCHIVE"]["BATCH_SIZE"])
+    print(f"archived {moved} games in {time.perf_counter() - start:.1f}s")
+    con.execute("VACUUM")
+    con.close()
+
+    for label, path in [("all games live", hot), ("archived", archived)]:
+        print(f"{label}: {os.path.getsize(path) / 2**20:.1f} MiB")
+        for name, size in sizes(path):
+            print(f"  {name:<32} {size / 2**20:8.1f} MiB")
+
+    con = sqlite3.connect(hot)
+    sample = random.sample(con.execute("SELECT username, uuid FROM games").fetchall(), args.lookups)
+    con.close()
+    usernames = [username for username, _ in sample]
+    # Warm the page cache for both files before timing
+    list_latency(hot, usernames)
+    list_latency(archived, usernames)
+    print(f"list in progress, all games live: {list_latency(hot, usernames):6.1f} us")
+    print(f"list in progress, archived:       {list_latency(archived, usernames):6.1f} us")
+
+    expected, hot_ms = asyncio.run(responses(hot, sample))
+    result, archived_ms = asyncio.run(responses(archived, sample))
+    assert result == expected
+    print(f"GET /games/<id>, all games live: {hot_ms:6.2f} ms")
+    print(f"GET /games/<id>, archived:       {archived_ms:6.2f} ms")
+
+    stats = user_stats(archived)
+    con = sqlite3.connect(archived, isolation_level=None)
+    con.execute("BEGIN IMMEDIATE")
+    rebuild_stats.rebuild(con.cursor())
+    con.execute("COMMIT")
+    con.close()
+    assert user_stats(archived) == stats == user_stats(hot)
+    print(f"{len(sample)} games, their users' game lists and statistics answer as before")
+    print(f"{check_guesses(hot, archived)} archived games unpack to their original guesses")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+# Benchmark the /login auth check (what nginx's auth_request calls for every
+# game request) along its two paths: Basic auth with a cold credential cache,
+# where every request runs PBKDF2 in the worker processes, and a warm one,
+# where none do; and signed tokens, which need no database or PBKDF2.
+#
+#   python3 -m bench.auth [--users N] [--concurrency C]
+import argparse
+import asyncio
+import time
+
+import user
+from bench.common import basic_auth, build_user_db, configure_user, drive, report
+
+PASSWORD = "correct horse battery staple"
+
+
+async def run(users, concurrency):
+    configure_user(user.app, build_user_db(users, PASSWORD))
+    headers = [basic_auth(f"user{i}", PASSWORD) for i in range(users)]
+
+    async with user.app.test_app() as test_app:
+        client = test_app.test_client()
+
+        async def login(i):
+            response = await client.get("/login", headers=headers[i % users])
+            assert response.status_code == 200, response.status_code
+
+        # Each user's first login misses the cache, later ones hit it
+        report(f"cold cache x{concurrency}", users, await drive(login, users, concurrency))
+        report(f"warm cache x{concurrency}", users, await drive(login, users, concurrency))
+
+        response = await client.get("/login?token=true", headers=headers[0])
+        token = {"Authorization": "Bearer " + (await response.get_json())["token"]}
+        # A token only gets a new token with the password
+        response = await client.get("/login?token=true", headers=token)
+        assert response.status_code == 400, response.status_code
+
+        async def login_token(i):
+            response = await client.get("/login", headers=token)
+            assert response.status_code == 200, response.status_code
+
+        report(f"token x{concurrency}", users, await drive(login_token, users, concurrency))
+
+        # The token check on its own, without the HTTP request around it
+        value = token["Authorization"].split()[1]
+        start = time.perf_counter()
+        for _ in range(10000):
+            assert user.verify_token(value) == "user0"
+        print(f"verify_token: {(time.perf_counter() - start) / 10000 * 1e6:.1f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark /login")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+    asyncio.run(run(args.users, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
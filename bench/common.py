@@ -0,0 +1,152 @@
+# Shared helpers for the benchmark scripts. Run them from the project root,
+# e.g. `python3 -m bench.play_game`.
+import asyncio
+import base64
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.append("./bin")
+import word_init
+
+
+# Build a fresh game.db (word lists plus empty games/guesses tables) under a
+# temporary directory, returning its path.
+def build_game_db(directory=None):
+    directory = directory or tempfile.mkdtemp(prefix="wordle-bench-")
+    path = os.path.join(directory, "game.db")
+    con = sqlite3.connect(path)
+    with open("./share/words.sql") as file:
+        con.executescript(file.read())
+    word_init.populate_words(con.cursor())
+    con.commit()
+    for script in [
+        "./share/games.sql",
+        "./share/replication.sql",
+        "./share/stats.sql",
+        "./share/outbox.sql",
+        "./share/archive.sql",
+    ]:
+        with open(script) as file:
+            con.executescript(file.read())
+    con.close()
+    return path
+
+
+# Point every game database URL (primary and replicas) at one SQLite file.
+# Finished games stay in the outbox: there is no leaderboard service to
+# send them to.
+def configure_game(app, path):
+    url = "sqlite+aiosqlite:///" + path
+    for key in app.config["DATABASES"]:
+        if key.startswith("GAME_"):
+            app.config["DATABASES"][key] = url
+    app.config["OUTBOX"]["DRAIN"] = False
+
+
+# Point the primary at `path` and each replica at a copy of it in the same
+# directory, so reads are routed between separate files and can lag the
+# primary as with LiteFS. Start a Replicator to keep the copies current.
+# Returns the replica paths.
+def configure_replicated_game(app, path):
+    configure_game(app, path)
+    replicas = []
+    for n, key in enumerate(["GAME_SECONDARY1_URL", "GAME_SECONDARY2_URL"], 1):
+        replica = os.path.join(os.path.dirname(path), f"replica{n}.db")
+        shutil.copyfile(path, replica)
+        app.config["DATABASES"][key] = "sqlite+aiosqlite:///" + replica
+        replicas.append(replica)
+    return replicas
+
+
+# Stands in for LiteFS: copies the primary into every replica file with
+# SQLite's online backup, then waits `interval` seconds, so replicas trail
+# the primary by about that much plus the copy.
+class Replicator:
+    def __init__(self, primary, replicas, interval=0.1):
+        self.primary = primary
+        self.replicas = replicas
+        self.interval = interval
+        self.copies = 0
+        self._task = None
+
+    def _copy(self):
+        source = sqlite3.connect(self.primary)
+        try:
+            for replica in self.replicas:
+                target = sqlite3.connect(replica, timeout=5)
+                try:
+                    source.backup(target)
+                finally:
+                    target.close()
+        finally:
+            source.close()
+
+    async def _replicate_forever(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await loop.run_in_executor(None, self._copy)
+            self.copies += 1
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._replicate_forever())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+def basic_auth(username, password):
+    token = base64.b64encode(f"{username}:{password}".encode()).decode()
+    return {"Authorization": "Basic " + token}
+
+
+# Run `requests` calls of the coroutine function `call(i)` with at most
+# `concurrency` in flight, returning the elapsed wall-clock seconds.
+async def drive(call, requests, concurrency):
+    counter = iter(range(requests))
+
+    async def worker():
+        for i in counter:
+            await call(i)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - start
+
+
+def report(label, requests, elapsed):
+    print(f"{label:<24} {requests:>7} requests {elapsed:8.2f}s {requests / elapsed:10.1f} req/s")
+
+
+# Build a fresh user.db with `count` users named user0, user1, ... all with
+# `password`. The password is hashed once and shared, so seeding is fast.
+def build_user_db(count, password, directory=None):
+    import user
+
+    directory = directory or tempfile.mkdtemp(prefix="wordle-bench-")
+    path = os.path.join(directory, "user.db")
+    con = sqlite3.connect(path)
+    with open("./share/users.sql") as file:
+        con.executescript(file.read())
+    password_hash = user.hash_password(password)
+    con.executemany(
+        "INSERT INTO users(username, password) VALUES(?, ?)",
+        ((f"user{i}", password_hash) for i in range(count)),
+    )
+    con.commit()
+    con.close()
+    return path
+
+
+def configure_user(app, path):
+    app.config["DATABASES"]["USER_URL"] = "sqlite+aiosqlite:///" + path
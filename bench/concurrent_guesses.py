@@ -0,0 +1,93 @@
+# Concurrency check for the guess commit path: fire many parallel guesses at
+# one game and verify that exactly six are accepted, the rest are rejected
+# with 409, and the stored history has no duplicate or missing guesses.
+#
+#   python3 -m bench.concurrent_guesses [--parallel N] [--rounds R]
+import argparse
+import asyncio
+import collections
+import random
+import sqlite3
+import uuid
+
+import game
+from bench.common import basic_auth, build_game_db, configure_game
+
+
+def seed_game(path, username):
+    con = sqlite3.connect(path)
+    secret_word_id, secret_word = con.execute(
+        "SELECT correct_word_id, correct_word FROM correct_words ORDER BY random() LIMIT 1"
+    ).fetchone()
+    words = [
+        word
+        for (word,) in con.execute(
+            "SELECT valid_word FROM valid_words WHERE valid_word != ?", (secret_word,)
+        )
+    ]
+    game_id = uuid.uuid4()
+    con.execute(
+        "INSERT INTO games(uuid, username, secret_word_id) VALUES(?, ?, ?)",
+        (game_id.bytes, username, secret_word_id),
+    )
+    con.commit()
+    con.close()
+    return str(game_id), words
+
+
+def check_game(path, game_id, statuses):
+    con = sqlite3.connect(path)
+    internal_id, state, guess_remaining = con.execute(
+        "SELECT game_id, state, guess_remaining FROM games WHERE uuid = ?",
+        (uuid.UUID(game_id).bytes,),
+    ).fetchone()
+    numbers = [
+        number
+        for (number,) in con.execute(
+            "SELECT guess_number FROM guesses WHERE game_id = ? ORDER BY guess_number",
+            (internal_id,),
+        )
+    ]
+    con.close()
+
+    assert statuses[200] == 6, statuses
+    assert statuses[409] == sum(statuses.values()) - 6, statuses
+    assert (state, guess_remaining) == (2, 0), (state, guess_remaining)
+    # The sixth (losing) guess ends the game and is not stored
+    assert numbers == [1, 2, 3, 4, 5], numbers
+
+
+async def run(parallel, rounds):
+    path = build_game_db()
+    configure_game(game.app, path)
+    headers = basic_auth("bench", "bench")
+
+    async with game.app.test_app() as test_app:
+        client = test_app.test_client()
+        for _ in range(rounds):
+            game_id, words = seed_game(path, "bench")
+            responses = await asyncio.gather(
+                *(
+                    client.post(
+                        f"/games/{game_id}",
+                        json={"guess": random.choice(words)},
+                        headers=headers,
+                    )
+                    for _ in range(parallel)
+                )
+            )
+            statuses = collections.Counter(r.status_code for r in responses)
+            check_game(path, game_id, statuses)
+    print(f"{rounds} games x {parallel} parallel guesses: no lost or duplicate guesses")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel guesses on one game")
+    parser.add_argument("--parallel", type=int, default=32)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(run(args.parallel, args.rounds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+# End-to-end load test: concurrent players going through the whole
+# lifecycle across the user, game and leaderboard services, in-process:
+# register, login (asking for a token), create a game, up to six guesses,
+# check progress, list games, statistics, then report finished games to the
+# leaderboard and read the top 10. The game service gets the username from
+# the X-Auth-User header of the login response, as nginx passes it on. The
+# two game replicas are copies of the primary, refreshed in the background
+# (see bench.common.Replicator), so reads are routed, lag and fall back to
+# the primary for read-your-writes as in a deployment; --single-file points
+# every game database URL at one file instead.
+#
+# Prints throughput and p50/p95/p99 latency per endpoint, and saves them as
+# JSON under bench/results/ so runs on different commits can be compared:
+#
+#   python3 -m bench.e2e [--players 200] [--concurrency 16] [--fake] [--single-file]
+#   python3 -m bench.e2e --compare bench/results/e2e-<commit>.json
+import argparse
+import asyncio
+import collections
+import json
+import os
+import random
+import subprocess
+import time
+
+import game
+import leaderboard
+import user
+from bench.common import (
+    Replicator,
+    basic_auth,
+    build_game_db,
+    build_user_db,
+    configure_game,
+    configure_replicated_game,
+    configure_user,
+)
+from bench.leaderboard import use_fake_redis
+
+RESULTS = "./bench/results"
+
+
+# Nearest-rank percentile of a sorted list
+def percentile(values, p):
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+def summarize(latencies, elapsed):
+    endpoints = {}
+    for label, values in sorted(latencies.items()):
+        values = sorted(values)
+        endpoints[label] = {
+            "count": len(values),
+            "rps": len(values) / elapsed,
+            "p50_ms": percentile(values, 50) * 1000,
+            "p95_ms": percentile(values, 95) * 1000,
+            "p99_ms": percentile(values, 99) * 1000,
+        }
+    return endpoints
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return commit + ("-dirty" if dirty else "")
+
+
+def print_results(results, baseline=None):
+    print(
+        f"{results['players']} players, {results['requests']} requests in "
+        f"{results['elapsed_s']:.2f}s: {results['rps']:.1f} req/s, "
+        f"{results['players'] / results['elapsed_s']:.1f} lifecycles/s"
+    )
+    # Results saved before replicas were separate files have no routes
+    if results.get("read_routes"):
+        routes = ", ".join(f"{route} {count}" for route, count in sorted(results["read_routes"].items()))
+        print(f"game reads routed: {routes}")
+    header = f"{'endpoint':<28} {'count':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+    if baseline:
+        header += f"   vs {baseline['commit']} (p50/p95/p99)"
+    print(header)
+    for label, row in results["endpoints"].items():
+        line = (
+            f"{label:<28} {row['count']:>6} {row['rps']:>8.1f} "
+            f"{row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f} {row['p99_ms']:>8.2f}"
+        )
+        before = (baseline or {}).get("endpoints", {}).get(label)
+        if before:
+            line += "   " + " ".join(
+                f"{(row[key] - before[key]) / before[key] * 100:+6.1f}%"
+                for key in ["p50_ms", "p95_ms", "p99_ms"]
+            )
+        print(line)
+
+
+async def run(players, concurrency, words, replicator=None):
+    latencies = collections.defaultdict(list)
+
+    async def timed(label, call):
+        start = time.perf_counter()
+        response = await call
+        latencies[label].append(time.perf_counter() - start)
+        return response
+
+    async with user.app.test_app() as user_app, game.app.test_app() as game_app, \
+            leaderboard.app.test_app() as leaderboard_app:
+        await leaderboard.redis_client.flushdb()
+        if replicator is not None:
+            replicator.start()
+        users = user_app.test_client()
+        scores = leaderboard_app.test_client()
+
+        async def lifecycle(i):
+            username, password = f"player{i}", f"password{i}"
+            response = await timed(
+                "POST /register",
+                users.post("/register", json={"username": username, "password": password}),
+            )
+            assert response.status_code == 201, response.status_code
+            response = await timed(
+                "GET /login",
+                users.get("/login?token=true", headers=basic_auth(username, password)),
+            )
+            assert response.status_code == 200, response.status_code
+            token = (await response.get_json())["token"]
+
+            # Each player has its own client, so its replication position
+            # cookie stays its own; login again with the token per request,
+            # as nginx's auth_request does
+            games = game_app.test_client()
+
+            async def authenticated(method, path, label, **kwargs):
+                response = await timed(
+                    "GET /login (token)",
+                    users.get("/login", headers={"Authorization": "Bearer " + token}),
+                )
+                assert response.status_code == 200, response.status_code
+                headers = {user.AUTH_USER_HEADER: response.headers[user.AUTH_USER_HEADER]}
+                response = await timed(label, games.open(path, method=method, headers=headers, **kwargs))
+                assert response.status_code == 200, (label, response.status_code)
+                return await response.get_json()
+
+            game_id = (await authenticated("POST", "/games", "POST /games"))["game_id"]
+            state = game.STATES[0]
+            for guess in random.sample(words, random.randint(1, 6)):
+                result = await authenticated(
+                    "POST", f"/games/{game_id}", "POST /games/<id>", json={"guess": guess}
+                )
+                state = result["game_state"]
+                if state != game.STATES[0]:
+                    break
+            progress = await authenticated("GET", f"/games/{game_id}", "GET /games/<id>")
+            await authenticated("GET", "/games", "GET /games")
+            await authenticated("GET", "/games/statistics", "GET /games/statistics")
+
+            if state != game.STATES[0]:
+                response = await timed(
+                    "POST /leaderboard/add",
+                    scores.post(
+                        "/leaderboard/add",
+                        json={
+                            "game_id": game_id,
+                            "username": username,
+                            "is_win": state == game.STATES[1],
+                            "number_of_guesses": progress["number_of_guesses"],
+                        },
+                    ),
+                )
+                assert response.status_code == 200, response.status_code
+            response = await timed("GET /leaderboard/top10", scores.get("/leaderboard/top10"))
+            assert response.status_code == 200, response.status_code
+
+        counter = iter(range(players))
+
+        async def worker():
+            for i in counter:
+                await lifecycle(i)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        if replicator is not None:
+            await replicator.stop()
+        routes = dict(game.replica_set.routes)
+        await leaderboard.redis_client.flushdb()
+
+    requests = sum(len(values) for values in latencies.values())
+    return {
+        "commit": git_commit(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "players": players,
+        "concurrency": concurrency,
+        "requests": requests,
+        "elapsed_s": elapsed,
+        "rps": requests / elapsed,
+        "replicas": replicator is not None,
+        "read_routes": routes,
+        "endpoints": summarize(latencies, elapsed),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end load test")
+    parser.add_argument("--players", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--redis-db", type=int, default=15)
+    parser.add_argument("--fake", action="store_true", help="in-memory Redis")
+    parser.add_argument("--single-file", action="store_true", help="no separate replica files")
+    parser.add_argument("--output", help="results file (default bench/results/e2e-<commit>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare with")
+    args = parser.parse_args()
+
+    random.seed(449)
+    path = build_game_db()
+    replicator = None
+    if args.single_file:
+        configure_game(game.app, path)
+    else:
+        replicator = Replicator(path, configure_replicated_game(game.app, path))
+    configure_user(user.app, build_user_db(0, ""))
+    leaderboard.app.config["REDIS"]["DB"] = args.redis_db
+    if args.fake:
+        use_fake_redis()
+
+    with open("./share/correct.json") as file:
+        words = json.load(file)
+    results = asyncio.run(run(args.players, args.concurrency, words, replicator))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+    print_results(results, baseline)
+
+    output = args.output or os.path.join(RESULTS, f"e2e-{results['commit']}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as file:
+        json.dump(results, file, indent=2)
+    print(f"Saved {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+# Micro-benchmark of the feedback engine against the original compare(), and
+# a check that both produce identical output (duplicate letters included).
+#
+#   python3 -m bench.feedback [--pairs N]
+import argparse
+import itertools
+import json
+import random
+import time
+
+import feedback
+
+
+# The original compare() from game.py, kept as the reference implementation
+def legacy_compare(secret_word, guess):
+    secret_word_lst = [i for i in enumerate(secret_word)]
+    guess_list = [i for i in enumerate(guess)]
+
+    temp_correct_positions = []
+    correct_positions = []
+    incorrect_positions = []
+    for i in range(0, len(secret_word)):
+        if guess_list[i][1] == secret_word_lst[i][1]:
+            temp_correct_positions.append(guess_list[i])
+            correct_positions.append(((guess_list[i][0] + 1), guess_list[i][1]))
+
+    secret_word_lst = [i for i in secret_word_lst if i not in temp_correct_positions]
+    guess_list = [i for i in guess_list if i not in temp_correct_positions]
+
+    for i in range(len(guess_list)):
+        for j in range(len(secret_word_lst)):
+            # found a character which is in a different position
+            if guess_list[i][1] == secret_word_lst[j][1]:
+                incorrect_positions.append((guess_list[i][0] + 1, guess_list[i][1]))
+                secret_word_lst.pop(j)
+                break
+
+    return correct_positions, incorrect_positions
+
+
+def load_words():
+    with open("./share/correct.json") as file:
+        correct = json.load(file)
+    with open("./share/valid.json") as file:
+        valid = json.load(file) + correct
+    return correct, valid
+
+
+# Every output must match the original, for random pairs and for all words
+# over a three letter alphabet, which covers every duplicate-letter layout
+def check(pairs):
+    small = ["".join(letters) for letters in itertools.product("abc", repeat=5)]
+    exhaustive = [(secret, guess) for secret in small for guess in small]
+    for secret, guess in itertools.chain(pairs, exhaustive):
+        assert feedback.compare(secret, guess) == legacy_compare(secret, guess), (
+            secret,
+            guess,
+        )
+
+    secrets = feedback.encode_words([secret for secret, _ in pairs])
+    guesses = feedback.encode_words([guess for _, guess in pairs])
+    codes = feedback.patterns(secrets, guesses)
+    for (secret, guess), code in zip(pairs, codes):
+        assert code == feedback.pattern(secret, guess), (secret, guess)
+    print(f"checked {len(pairs) + len(exhaustive)} pairs against compare()")
+
+
+def timed(label, count, fn):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<32} {count / elapsed / 1e6:8.3f} M pairs/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Wordle feedback")
+    parser.add_argument("--pairs", type=int, default=200000)
+    args = parser.parse_args()
+
+    random.seed(449)
+    correct, valid = load_words()
+    pairs = [(random.choice(correct), random.choice(valid)) for _ in range(args.pairs)]
+    check(pairs)
+
+    timed("legacy compare()", len(pairs), lambda: [legacy_compare(s, g) for s, g in pairs])
+    timed("feedback.compare()", len(pairs), lambda: [feedback.compare(s, g) for s, g in pairs])
+    timed("feedback.pattern()", len(pairs), lambda: [feedback.pattern(s, g) for s, g in pairs])
+
+    secret = feedback.encode_words([correct[0]])[0]
+    encoded_valid = feedback.encode_words(valid)
+    encoded_correct = feedback.encode_words(correct)
+    guess = encoded_valid[0]
+    timed(
+        "patterns(): 1 secret x guesses",
+        len(valid),
+        lambda: feedback.patterns(secret, encoded_valid),
+    )
+    timed(
+        "patterns(): secrets x 1 guess",
+        len(correct),
+        lambda: feedback.patterns(encoded_correct, guess),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# Compare write throughput of the game service with and without group commit
+# at increasing concurrency. Each client plays games: it creates one, then
+# makes five guesses that never end it, one in ten of them not a valid word
+# (rejected with 400, so rolled back inside its batch). Afterwards it checks
+# that every accepted write, and nothing else, is in the database.
+#
+#   python3 -m bench.group_commit [--requests 3000] [--concurrency 1,8,32,128]
+import argparse
+import asyncio
+import collections
+import random
+import sqlite3
+
+import game
+from bench.common import basic_auth, build_game_db, configure_game, drive, report
+
+GUESSES_PER_GAME = 5
+
+
+def wrong_words(path):
+    con = sqlite3.connect(path)
+    words = [
+        word
+        for (word,) in con.execute(
+            """
+            SELECT valid_word FROM valid_words
+            WHERE valid_word NOT IN (SELECT correct_word FROM correct_words)
+            """
+        )
+    ]
+    con.close()
+    return words
+
+
+def check(path, statuses):
+    con = sqlite3.connect(path)
+    games = con.execute("SELECT count(*) FROM games").fetchone()[0]
+    guesses = con.execute("SELECT count(*) FROM guesses").fetchone()[0]
+    in_progress = con.execute("SELECT sum(in_progress) FROM user_stats").fetchone()[0]
+    con.close()
+    assert games == in_progress == statuses["create"], (games, in_progress, statuses)
+    assert guesses == statuses["guess"], (guesses, statuses)
+
+
+async def run(label, requests, concurrency, enabled):
+    path = build_game_db()
+    configure_game(game.app, path)
+    game.app.config["GROUP_COMMIT"]["ENABLED"] = enabled
+    words = wrong_words(path)
+    statuses = collections.Counter()
+
+    async with game.app.test_app() as test_app:
+        client = test_app.test_client()
+        games = {}
+
+        async def call(i):
+            # Each worker keeps its own game going; requests are shared out
+            # by `drive`, so key the game on the task
+            task = asyncio.current_task()
+            headers = basic_auth(f"user{id(task) % 100}", "bench")
+            game_id, made = games.get(task, (None, GUESSES_PER_GAME))
+            if made == GUESSES_PER_GAME:
+                response = await client.post("/games", headers=headers)
+                assert response.status_code == 200, await response.get_data()
+                games[task] = ((await response.get_json())["game_id"], 0)
+                statuses["create"] += 1
+                return
+            invalid = random.random() < 0.1
+            response = await client.post(
+                f"/games/{game_id}",
+                json={"guess": "zzzzz" if invalid else random.choice(words)},
+                headers=headers,
+            )
+            if invalid:
+                assert response.status_code == 400, await response.get_data()
+                statuses["invalid"] += 1
+                return
+            assert response.status_code == 200, await response.get_data()
+            games[task] = (game_id, made + 1)
+            statuses["guess"] += 1
+
+        elapsed = await drive(call, requests, concurrency)
+        counts = dict(game.group_commit.counts) if enabled else {}
+    check(path, statuses)
+    report(f"{label} x{concurrency}", requests, elapsed)
+    if counts:
+        writes = counts.get("committed", 0) + counts.get("rolled_back", 0)
+        print(f"{'':<24} {writes / counts['batches']:.1f} writes per commit")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark group commit")
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--concurrency", default="1,8,32,128")
+    args = parser.parse_args()
+    for concurrency in map(int, args.concurrency.split(",")):
+        for enabled in (False, True):
+            random.seed(449)
+            label = "group commit" if enabled else "commit each"
+            asyncio.run(run(label, args.requests, concurrency, enabled))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+# Compare the old games/guesses layout (VARCHAR UUID keys repeated in every
+# guess and in its index) with the compact one in share/games.sql. Builds an
+# old-layout game.db, converts a copy with bin/migrate_layout.py, and reports
+# the size of each table and index and the latency of reading one game and
+# its guesses, the way GET /games/<id> does.
+#
+#   python3 -m bench.layout [--games 200000] [--lookups 20000]
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import time
+import uuid
+
+from bench.common import build_game_db
+
+sys.path.append("./bin")
+import migrate_layout
+
+# share/games.sql before the compact layout
+OLD_LAYOUT = """
+DROP TABLE IF EXISTS guesses;
+DROP TABLE IF EXISTS games;
+CREATE TABLE games (
+    game_id VARCHAR PRIMARY KEY,
+    username VARCHAR NOT NULL,
+    secret_word_id INTEGER NOT NULL,
+    state INTEGER DEFAULT 0,
+    guess_remaining INTEGER DEFAULT 6
+);
+CREATE TABLE guesses(
+    guess_id INTEGER PRIMARY KEY,
+    game_id VARCHAR NOT NULL,
+    valid_word_id INTEGER NULL,
+    guess_number INTEGER NOT NULL,
+    feedback INTEGER
+);
+CREATE INDEX games_idx_usernamestate ON games(username, state);
+CREATE INDEX guesses_idx_idnumber ON guesses(game_id, guess_number, valid_word_id, feedback);
+"""
+
+# One game read, as GET /games/<id> does it: the game row, then its guesses
+def read_old(con, username, game_id):
+    con.execute(
+        """
+        SELECT secret_word_id, guess_remaining, state
+        FROM games WHERE username=:username AND game_id=:game_id
+        """,
+        {"username": username, "game_id": game_id},
+    ).fetchone()
+    return con.execute(
+        """
+        SELECT guess_number, valid_word_id, feedback
+        FROM guesses WHERE game_id=:game_id ORDER BY guess_number
+        """,
+        {"game_id": game_id},
+    ).fetchall()
+
+
+def read_compact(con, username, game_uuid):
+    game = con.execute(
+        """
+        SELECT game_id, secret_word_id, guess_remaining, state
+        FROM games WHERE username=:username AND uuid=:uuid
+        """,
+        {"username": username, "uuid": game_uuid},
+    ).fetchone()
+    return con.execute(
+        """
+        SELECT guess_number, valid_word_id, feedback
+        FROM guesses WHERE game_id=:game_id ORDER BY guess_number
+        """,
+        {"game_id": game[0]},
+    ).fetchall()
+
+
+def build_old(games):
+    path = build_game_db()
+    con = sqlite3.connect(path)
+    con.executescript(OLD_LAYOUT)
+    rows, guesses = [], []
+    for i in range(games):
+        game_id = str(uuid.uuid4())
+        rows.append((game_id, f"user{i % 1000}", random.randint(1, 2309), 0, 2))
+        guesses += [(game_id, random.randint(1, 12000), n, random.randint(0, 242)) for n in range(1, 5)]
+    con.executemany("INSERT INTO games VALUES(?, ?, ?, ?, ?)", rows)
+    con.executemany(
+        "INSERT INTO guesses(game_id, valid_word_id, guess_number, feedback) VALUES(?, ?, ?, ?)",
+        guesses,
+    )
+    con.commit()
+    con.execute("VACUUM")
+    con.close()
+    return path
+
+
+def sizes(path):
+    con = sqlite3.connect(path)
+    rows = con.execute(
+        """
+        SELECT name, sum(pgsize) FROM dbstat
+        WHERE name LIKE '%games%' OR name LIKE '%guesses%'
+        GROUP BY name ORDER BY name
+        """
+    ).fetchall()
+    con.close()
+    return rows
+
+
+# Microseconds per game read
+def read_latency(path, read, keys):
+    con = sqlite3.connect(path)
+    start = time.perf_counter()
+    for username, key in keys:
+        assert len(read(con, username, key)) == 4
+    elapsed = time.perf_counter() - start
+    con.close()
+    return elapsed / len(keys) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the game.db layouts")
+    parser.add_argument("--games", type=int, default=200000)
+    parser.add_argument("--lookups", type=int, default=20000)
+    args = parser.parse_args()
+    random.seed(449)
+
+    old = build_old(args.games)
+    new = os.path.join(os.path.dirname(old), "game-compact.db")
+    shutil.copyfile(old, new)
+    con = migrate_layout.open_database(new)
+    con.execute("BEGIN IMMEDIATE")
+    migrate_layout.migrate(con.cursor())
+    con.execute("COMMIT")
+    con.execute("VACUUM")
+    con.close()
+
+    for label, path in [("old", old), ("compact", new)]:
+        print(f"{label}: {os.path.getsize(path) / 2**20:.1f} MiB")
+        for name, size in sizes(path):
+            print(f"  {name:<32} {size / 2**20:8.1f} MiB")
+
+    con = sqlite3.connect(old)
+    sample = random.sample(
+        con.execute("SELECT username, game_id FROM games").fetchall(), args.lookups
+    )
+    con.close()
+    old_keys = sample
+    new_keys = [(username, uuid.UUID(game_id).bytes) for username, game_id in sample]
+    # Warm the page cache for both files before timing
+    read_latency(old, read_old, old_keys)
+    read_latency(new, read_compact, new_keys)
+    print(f"old:     {read_latency(old, read_old, old_keys):6.1f} us per game read")
+    print(f"compact: {read_latency(new, read_compact, new_keys):6.1f} us per game read")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# Load test for the leaderboard service: many concurrent clients calling
+# POST /leaderboard/add, GET /leaderboard/top10 (cached, conditional, and
+# revalidated on every request), leaderboard pages and rank lookups through
+# the app's pooled Redis client. Uses a scratch Redis database (flushed first), or an
+# in-memory fake with --fake (requires `pip install fakeredis[lua]`).
+#
+#   python3 -m bench.leaderboard [--clients 200] [--requests 20000] [--redis-db 15]
+import argparse
+import asyncio
+import random
+import uuid
+
+import leaderboard
+from bench.common import drive, report
+
+
+# Same blocking pool as the app, with fakeredis connections behind it
+def use_fake_redis():
+    import fakeredis
+    import fakeredis.aioredis
+
+    server = fakeredis.FakeServer()
+
+    def create_redis():
+        pool = leaderboard.redis.BlockingConnectionPool(
+            connection_class=fakeredis.aioredis.FakeConnection,
+            server=server,
+            max_connections=leaderboard.app.config["REDIS"]["MAX_CONNECTIONS"],
+        )
+        return leaderboard.redis.Redis(connection_pool=pool)
+
+    leaderboard._create_redis = create_redis
+
+
+async def run(requests, clients, users):
+    async with leaderboard.app.test_app() as test_app:
+        await leaderboard.redis_client.flushdb()
+        client = test_app.test_client()
+        usernames = [f"user{i}" for i in range(users)]
+
+        async def add(i):
+            response = await client.post(
+                "/leaderboard/add",
+                json={
+                    "game_id": str(uuid.uuid4()),
+                    "username": random.choice(usernames),
+                    "is_win": random.random() < 0.8,
+                    "number_of_guesses": random.randint(1, 6),
+                },
+            )
+            assert response.status_code == 200, await response.get_data()
+
+        async def top10(i):
+            response = await client.get("/leaderboard/top10")
+            assert response.status_code == 200, await response.get_data()
+
+        async def top10_unchanged(i):
+            response = await client.get("/leaderboard/top10", headers={"If-None-Match": etag})
+            assert response.status_code == 304, response.status_code
+
+        async def page(i):
+            response = await client.get(f"/leaderboard?offset={random.randrange(0, 900)}&limit=50")
+            assert response.status_code == 200, await response.get_data()
+
+        async def rank(i):
+            response = await client.get(f"/leaderboard/users/{random.choice(usernames)}")
+            # Users who were never picked by add() are not ranked
+            assert response.status_code in (200, 404), await response.get_data()
+
+        report(f"add x{clients}", requests, await drive(add, requests, clients))
+        report(f"top10 x{clients}", requests, await drive(top10, requests, clients))
+        etag = (await client.get("/leaderboard/top10")).headers["ETag"]
+        report(f"top10 304 x{clients}", requests, await drive(top10_unchanged, requests, clients))
+        report(f"page x{clients}", requests, await drive(page, requests, clients))
+        report(f"rank x{clients}", requests, await drive(rank, requests, clients))
+        # Ask Redis for the version on every read instead
+        leaderboard.top_caches["all"].check = 0
+        report(f"top10 revalidated x{clients}", requests, await drive(top10, requests, clients))
+        await leaderboard.redis_client.flushdb()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the leaderboard")
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--redis-db", type=int, default=15)
+    parser.add_argument("--fake", action="store_true")
+    args = parser.parse_args()
+
+    random.seed(449)
+    leaderboard.app.config["REDIS"]["DB"] = args.redis_db
+    if args.fake:
+        use_fake_redis()
+    asyncio.run(run(args.requests, args.clients, args.users))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+# Compare reporting finished games to the leaderboard one POST /leaderboard/add
+# per game (what clients had to do) with the game service's outbox, drained
+# in batches to POST /leaderboard/add/batch. Plays games to the end through
+# the game service, so each one is queued in leaderboard_outbox, then checks
+# that both ways give the same leaderboard and that resending a batch (a lost
+# acknowledgement) changes nothing. Also checks that an entry the leaderboard
+# always rejects is given up on without holding up the ones behind it.
+#
+#   python3 -m bench.outbox [--games 5000] [--batch 500] [--redis-db 15] [--fake]
+import argparse
+import asyncio
+import random
+import sqlite3
+import uuid
+
+import game
+import leaderboard
+from bench.common import basic_auth, build_game_db, configure_game, drive, report
+from bench.leaderboard import use_fake_redis
+from outbox import OutboxDrainer, claim_entries, entry, queue_entry
+from pool import Pool
+
+USERS = 100
+
+
+# Finish `count` games through the game service: a few wrong guesses, then
+# the secret (read from the database) or a loss
+async def play_games(path, count):
+    con = sqlite3.connect(path)
+    wrong = [
+        word
+        for (word,) in con.execute(
+            """
+            SELECT valid_word FROM valid_words
+            WHERE valid_word NOT IN (SELECT correct_word FROM correct_words)
+            """
+        )
+    ]
+    async with game.app.test_app() as test_app:
+        client = test_app.test_client()
+
+        async def play(i):
+            headers = basic_auth(f"user{i % USERS}", "bench")
+            game_id = (await (await client.post("/games", headers=headers)).get_json())["game_id"]
+            (secret,) = con.execute(
+                """
+                SELECT correct_word FROM games
+                JOIN correct_words ON correct_word_id = secret_word_id
+                WHERE uuid = ?
+                """,
+                (game.parse_game_id(game_id),),
+            ).fetchone()
+            misses = random.randint(0, 6)
+            for n in range(6):
+                guess = random.choice(wrong) if n < misses else secret
+                response = await client.post(
+                    f"/games/{game_id}", json={"guess": guess}, headers=headers
+                )
+                assert response.status_code == 200, await response.get_data()
+                if "number_of_guesses" in await response.get_json():
+                    break
+
+        await drive(play, count, 8)
+    con.close()
+
+
+async def leaderboard_snapshot():
+    return await leaderboard.redis_client.zrange("leaderboard", 0, -1, withscores=True)
+
+
+# One entry a batch, the first rejected every time: it moves to the dead
+# letter table after three tries, then the other two are sent
+async def check_dead_letter(db):
+    for username in ["rejected", "user0", "user1"]:
+        await db.transaction(queue_entry, uuid.uuid4().bytes, username, True, 3)
+    sent = []
+
+    async def send(entries):
+        if any(entry["username"] == "rejected" for entry in entries):
+            raise ValueError("rejected")
+        sent.extend(entries)
+
+    drainer = OutboxDrainer(db, send, batch=1, lease=0, max_attempts=3)
+    for _ in range(6):
+        await drainer.drain_once()
+    assert [entry["username"] for entry in sent] == ["user0", "user1"], sent
+    dead = await db.fetch_all("SELECT username, attempts FROM leaderboard_outbox_dead")
+    assert [tuple(row) for row in dead] == [("rejected", 3)], dead
+    assert drainer.counts["failed"] == 3 and drainer.counts["dead"] == 1, drainer.counts
+    print("a rejected entry is given up on and the ones behind it are sent")
+
+
+async def run(path, games, batch):
+    db = Pool("sqlite+aiosqlite:///" + path)
+    await db.connect()
+    async with leaderboard.app.test_app() as test_app:
+        client = test_app.test_client()
+        await leaderboard.redis_client.flushdb()
+
+        # One request per game; peek at the outbox without claiming it
+        rows = await db.fetch_all("SELECT * FROM leaderboard_outbox ORDER BY event_id")
+        assert len(rows) == games, (len(rows), games)
+        entries = [entry(row) for row in rows]
+
+        async def add(i):
+            response = await client.post("/leaderboard/add", json=entries[i])
+            assert response.status_code == 200, await response.get_data()
+
+        report("add per game x8", games, await drive(add, games, 8))
+        expected = await leaderboard_snapshot()
+        await leaderboard.redis_client.flushdb()
+
+        async def send(entries):
+            response = await client.post("/leaderboard/add/batch", json={"entries": entries})
+            assert response.status_code == 200, await response.get_data()
+
+        drainer = OutboxDrainer(db, send, batch=batch)
+        # A batch sent twice, as if the first acknowledgement had been lost
+        rows, _ = await db.transaction(claim_entries, batch, 0)
+        await send([entry(row) for row in rows])
+
+        async def drain(i):
+            while await drainer.drain_once():
+                pass
+
+        report(f"outbox, {batch} per batch", games, await drive(drain, 1, 1))
+        assert await leaderboard_snapshot() == expected
+        assert (await db.fetch_one("SELECT count(*) AS n FROM leaderboard_outbox"))["n"] == 0
+        print(f"{drainer.counts['batches']} batches; same leaderboard as one add per game")
+        await leaderboard.redis_client.flushdb()
+    await check_dead_letter(db)
+    await db.disconnect()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the leaderboard outbox")
+    parser.add_argument("--games", type=int, default=5000)
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--redis-db", type=int, default=15)
+    parser.add_argument("--fake", action="store_true")
+    args = parser.parse_args()
+
+    random.seed(449)
+    leaderboard.app.config["REDIS"]["DB"] = args.redis_db
+    if args.fake:
+        use_fake_redis()
+    path = build_game_db()
+    configure_game(game.app, path)
+    asyncio.run(play_games(path, args.games))
+    asyncio.run(run(path, args.games, args.batch))
+
+
+if __name__ == "__main__":
+    main()
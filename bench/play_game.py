@@ -0,0 +1,104 @@
+# Benchmark POST /games/<id> throughput with the pooled connections against
+# the old connect-per-request behaviour.
+#
+#   python3 -m bench.play_game [--requests N] [--concurrency C]
+import argparse
+import asyncio
+import contextlib
+import random
+import sqlite3
+import uuid
+
+import game
+from pool import Pool, PooledConnection
+from bench.common import basic_auth, build_game_db, configure_game, drive, report
+
+GUESSES_PER_GAME = 5
+
+
+# The pre-pool behaviour: a brand new SQLite connection for every query
+class ConnectPerQueryPool(Pool):
+    async def connect(self):
+        pass
+
+    async def disconnect(self):
+        pass
+
+    @contextlib.asynccontextmanager
+    async def connection(self):
+        connection = PooledConnection(self._path, self._statement_cache)
+        await connection.open()
+        try:
+            yield connection
+        finally:
+            await connection.close()
+
+
+# Seed enough in-progress games that every request is a non-final guess
+def seed_games(path, count, username):
+    con = sqlite3.connect(path)
+    secrets = con.execute("SELECT count(*) FROM correct_words").fetchone()[0]
+    # Never guess a possible secret, so no request ends its game
+    words = [
+        word
+        for (word,) in con.execute(
+            """
+            SELECT valid_word FROM valid_words
+            WHERE valid_word NOT IN (SELECT correct_word FROM correct_words)
+            """
+        )
+    ]
+    game_ids = []
+    for _ in range(count):
+        game_id = uuid.uuid4()
+        con.execute(
+            "INSERT INTO games(uuid, username, secret_word_id) VALUES(?, ?, ?)",
+            (game_id.bytes, username, random.randint(1, secrets)),
+        )
+        game_ids.append(str(game_id))
+    con.commit()
+    con.close()
+    return game_ids, words
+
+
+async def run(label, requests, concurrency, legacy):
+    path = build_game_db()
+    configure_game(game.app, path)
+    game_ids, words = seed_games(path, -(-requests // GUESSES_PER_GAME), "bench")
+    headers = basic_auth("bench", "bench")
+
+    if legacy:
+        game.Pool = ConnectPerQueryPool
+    try:
+        async with game.app.test_app() as test_app:
+            client = test_app.test_client()
+
+            async def call(i):
+                # Consecutive requests go to different games, so guesses on
+                # one game are never in flight at the same time
+                game_id = game_ids[i % len(game_ids)]
+                response = await client.post(
+                    f"/games/{game_id}",
+                    json={"guess": random.choice(words)},
+                    headers=headers,
+                )
+                assert response.status_code == 200, await response.get_data()
+
+            elapsed = await drive(call, requests, concurrency)
+    finally:
+        game.Pool = Pool
+    report(label, requests, elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark POST /games/<id>")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=1)
+    args = parser.parse_args()
+    random.seed(449)
+    asyncio.run(run("connect-per-query", args.requests, args.concurrency, True))
+    asyncio.run(run("pooled", args.requests, args.concurrency, False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+# Time candidate counting and hints on the memory-mapped feedback matrix
+# against filtering with feedback.pattern() per (secret, guess) pair, and
+# check both agree. Builds the matrix with bin/build_feedback_matrix.py in a
+# throwaway directory, then plays games through GET /games/<id>/hint.
+#
+#   python3 -m bench.solver [--games 200]
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import sys
+import time
+
+import numpy as np
+
+import feedback
+import game
+from bench.common import basic_auth, build_game_db, configure_game
+from solver import Solver
+from words import WordList
+
+sys.path.append("./bin")
+import build_feedback_matrix
+
+
+# The per-pair way: score every remaining secret against every guess
+def scalar_candidates(word_list, guesses):
+    return [
+        secret_id
+        for secret_id in range(1, len(word_list.correct_words))
+        if all(
+            feedback.pattern(word_list.secret_word(secret_id), word_list.valid_word(v)) == code
+            for v, code in guesses
+        )
+    ]
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return result, (time.perf_counter() - start) / repeat * 1000
+
+
+# Random games: (valid_word_id, code) feedback for 1 to 4 guesses
+def sample_games(word_list, count):
+    games = []
+    for _ in range(count):
+        secret = word_list.secret_word(word_list.random_secret_id())
+        guesses = []
+        for _ in range(random.randint(1, 4)):
+            valid_word_id = random.randrange(1, len(word_list.valid_words))
+            code = feedback.pattern(secret, word_list.valid_word(valid_word_id))
+            guesses.append((valid_word_id, code))
+        games.append(guesses)
+    return games
+
+
+async def play(path, games):
+    configure_game(game.app, path)
+    game.app.config["FEEDBACK_MATRIX"]["PATH"] = os.path.join(
+        os.path.dirname(path), "feedback.npy"
+    )
+    headers = basic_auth("bench", "bench")
+    turns, wins, elapsed = 0, 0, 0.0
+    async with game.app.test_app() as test_app:
+        client = test_app.test_client()
+        for _ in range(games):
+            game_id = (await (await client.post("/games", headers=headers)).get_json())["game_id"]
+            for _ in range(6):
+                start = time.perf_counter()
+                response = await client.get(f"/games/{game_id}/hint", headers=headers)
+                elapsed += time.perf_counter() - start
+                assert response.status_code == 200, await response.get_data()
+                guess = (await response.get_json())["guess"]
+                result = await (
+                    await client.post(f"/games/{game_id}", json={"guess": guess}, headers=headers)
+                ).get_json()
+                turns += 1
+                if result["game_state"] != game.STATES[0]:
+                    wins += result["game_state"] == game.STATES[1]
+                    break
+    print(
+        f"hint endpoint: {elapsed / turns * 1000:.2f} ms per hint, "
+        f"won {wins}/{games} games in {turns / games:.2f} guesses on average"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the feedback matrix solver")
+    parser.add_argument("--games", type=int, default=200)
+    args = parser.parse_args()
+    random.seed(449)
+
+    path = build_game_db()
+    matrix_path = os.path.join(os.path.dirname(path), "feedback.npy")
+    con = sqlite3.connect(path)
+    valid_words = build_feedback_matrix.words_by_id(con.cursor(), "valid_words")
+    correct_words = build_feedback_matrix.words_by_id(con.cursor(), "correct_words")
+    con.close()
+    start = time.perf_counter()
+    np.save(matrix_path, build_feedback_matrix.build(valid_words, correct_words))
+    print(f"built matrix in {time.perf_counter() - start:.1f}s")
+
+    word_list = WordList()
+    word_list.valid_words, word_list.correct_words = valid_words, correct_words
+    word_list.valid_ids = {word: i for i, word in enumerate(valid_words) if i}
+    word_list._correct_ids = list(range(1, len(correct_words)))
+    solver = Solver.load(
+        matrix_path, word_list, game.app.config["FEEDBACK_MATRIX"]["HINT_SAMPLE"]
+    )
+
+    games = sample_games(word_list, args.games)
+    scalar, vectorized = 0.0, 0.0
+    for guesses in games[:20]:
+        expected, ms = timed(lambda: scalar_candidates(word_list, guesses), 1)
+        scalar += ms / 20
+        result, ms = timed(lambda: solver.candidates(guesses), 10)
+        vectorized += ms / 20
+        assert list(result) == expected, guesses
+    print(f"candidates, pattern() per pair:        {scalar:8.2f} ms")
+    print(f"candidates, matrix:                    {vectorized:8.2f} ms")
+
+    (opening, bits), ms = timed(solver.opening, 1)
+    print(f"best opening guess ({word_list.valid_word(opening)}), exact: {ms:8.2f} ms")
+    # Marked in the matrix by the build, so loading it is cheap
+    (marked, marked_bits), ms = timed(solver._load_opening, 10)
+    assert (marked, round(marked_bits, 9)) == (opening, round(bits, 9))
+    print(f"best opening guess, marked in matrix:  {ms:8.2f} ms")
+    exact, sampled, same = 0.0, 0.0, 0
+    for guesses in games:
+        secrets = solver.candidates(guesses)
+        (best, _), ms = timed(lambda: solver._best_guess(secrets, exact=True), 1)
+        exact += ms / len(games)
+        (estimate, _), ms = timed(lambda: solver.best_guess(secrets), 1)
+        sampled += ms / len(games)
+        same += best == estimate
+    print(f"best guess after 1-4 guesses, exact:   {exact:8.2f} ms")
+    print(f"best guess after 1-4 guesses, sampled: {sampled:8.2f} ms ({same}/{len(games)} same guess)")
+
+    asyncio.run(play(path, min(args.games, 50)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# Simulate weeks of leaderboard traffic, a day at a time, and compare what
+# Redis keeps with the scheduled compaction against keeping every game, as
+# the leaderboard did before daily windows. Also times the weekly rollup and
+# top-10 reads of each window. Uses a scratch Redis database (flushed first)
+# or an in-memory fake with --fake.
+#
+#   python3 -m bench.windows [--days 30] [--games-per-day 2000] [--users 500]
+import argparse
+import asyncio
+import random
+import time
+import uuid
+
+import leaderboard
+from bench.leaderboard import use_fake_redis
+
+START = 20260101
+
+
+# Per-game entries left in the users' game hashes
+async def game_entries(users):
+    async with leaderboard.redis_client.pipeline(transaction=False) as pipe:
+        for i in range(users):
+            pipe.hlen(f"user:user{i}")
+        return sum(await pipe.execute())
+
+
+async def memory():
+    try:
+        return (await leaderboard.redis_client.info("memory"))["used_memory"]
+    except Exception:
+        return None
+
+
+async def run(days, games_per_day, users, compact):
+    async with leaderboard.app.test_app() as test_app:
+        await leaderboard.redis_client.flushdb()
+        client = test_app.test_client()
+        retain = leaderboard.app.config["LEADERBOARD"]["RETAIN_DAYS"]
+        for d in range(days):
+            day = leaderboard.days_before(START, -d)
+            leaderboard.today = lambda day=day: day
+            entries = [
+                {
+                    "game_id": str(uuid.uuid4()),
+                    "username": f"user{random.randrange(users)}",
+                    "is_win": random.random() < 0.8,
+                    "number_of_guesses": random.randint(1, 6),
+                }
+                for _ in range(games_per_day)
+            ]
+            for i in range(0, len(entries), 500):
+                response = await client.post(
+                    "/leaderboard/add/batch", json={"entries": entries[i : i + 500]}
+                )
+                assert response.status_code == 200, await response.get_data()
+            if compact:
+                start = time.perf_counter()
+                await leaderboard.rollup(day)
+                rollup_ms = (time.perf_counter() - start) * 1000
+                await leaderboard.compact(leaderboard.days_before(day, retain))
+
+        label = "compacted" if compact else "every game kept"
+        used = await memory()
+        print(
+            f"{label:<16} {await game_entries(users):>8} game entries"
+            + (f", {used / 2**20:.1f} MiB used" if used else "")
+        )
+        if compact:
+            print(f"{'':<16} weekly rollup of {users} users: {rollup_ms:.1f} ms")
+            for window in leaderboard.WINDOWS:
+                start = time.perf_counter()
+                for _ in range(200):
+                    # Bypass the cache: a new version every read
+                    await leaderboard.redis_client.incr(leaderboard.VERSION_KEY)
+                    response = await client.get(f"/leaderboard/top10?window={window}")
+                    assert response.status_code == 200
+                elapsed = (time.perf_counter() - start) / 200 * 1000
+                top = (await response.get_json())[0]
+                print(f"{'':<16} top10 {window:<7} {elapsed:6.2f} ms uncached, leader {top}")
+        await leaderboard.redis_client.flushdb()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark windowed leaderboards")
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--games-per-day", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--redis-db", type=int, default=15)
+    parser.add_argument("--fake", action="store_true")
+    args = parser.parse_args()
+
+    leaderboard.app.config["REDIS"]["DB"] = args.redis_db
+    leaderboard.app.config["LEADERBOARD"]["ROLLUP_MS"] = 0
+    leaderboard.app.config["LEADERBOARD"]["CHECK_MS"] = 0
+    if args.fake:
+        use_fake_redis()
+    for compact in (False, True):
+        random.seed(449)
+        asyncio.run(run(args.days, args.games_per_day, args.users, compact))
+
+
+if __name__ == "__main__":
+    main()
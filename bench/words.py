@@ -0,0 +1,84 @@
+# Compare loading the word lists from share/words.bin with reading the word
+# tables, as the game service does at startup and on SIGHUP, and with
+# parsing the JSON the way bin/word_init.py used to. Checks that both
+# sources give every word the same id.
+#
+#   python3 -m bench.words [--repeat 20]
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+from bench.common import build_game_db
+from pool import Pool
+from words import WordList
+
+sys.path.append("./bin")
+import word_init
+
+
+def parse_json():
+    with open("./share/correct.json") as file:
+        correct = [(word,) for word in json.load(file)]
+    with open("./share/valid.json") as file:
+        valid = [(word,) for word in json.load(file)]
+    return correct, valid + correct
+
+
+async def timed_load(db, path, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        word_list = WordList()
+        await word_list.load(db, path)
+    return word_list, (time.perf_counter() - start) / repeat * 1000
+
+
+async def run(repeat):
+    path = build_game_db()
+    db = Pool("sqlite+aiosqlite:///" + path)
+    await db.connect()
+    try:
+        tables, tables_ms = await timed_load(db, None, repeat)
+        packed, packed_ms = await timed_load(db, word_init.PACKED_WORDS, repeat)
+    finally:
+        await db.disconnect()
+    assert (tables.source, packed.source) == ("tables", "packed")
+
+    assert len(tables.valid_words) == len(packed.valid_words)
+    assert len(tables.correct_words) == len(packed.correct_words)
+    for word_id in range(1, len(tables.valid_words)):
+        word = tables.valid_word(word_id)
+        assert packed.valid_word(word_id) == word
+        assert packed.valid_word_id(word) == tables.valid_word_id(word), word
+    for word_id in range(1, len(tables.correct_words)):
+        assert packed.secret_word(word_id) == tables.secret_word(word_id)
+    assert packed.valid_word_id("zzzzz") is None and packed.valid_word_id("toolong") is None
+    print(f"checked {len(tables.valid_words) + len(tables.correct_words) - 2} words")
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        parse_json()
+    json_ms = (time.perf_counter() - start) / repeat * 1000
+    print(f"{'parse JSON':<18} {json_ms:8.2f} ms")
+    print(f"{'load word tables':<18} {tables_ms:8.2f} ms")
+    print(f"{'load words.bin':<18} {packed_ms:8.2f} ms")
+
+    guesses = [tables.valid_word(i) for i in range(1, len(tables.valid_words))]
+    for label, word_list in [("tables", tables), ("words.bin", packed)]:
+        start = time.perf_counter()
+        for word in guesses:
+            word_list.valid_word_id(word)
+        elapsed = time.perf_counter() - start
+        print(f"{'lookup (' + label + ')':<18} {elapsed / len(guesses) * 1e6:8.2f} us per guess")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark loading the word lists")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(run(args.repeat))
+
+
+if __name__ == "__main__":
+    main()
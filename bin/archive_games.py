@@ -0,0 +1,47 @@
+# Move games finished more than [ARCHIVE] RETAIN_DAYS days ago out of games
+# and guesses into archived_games, one row per game with its guesses packed
+# (see archive.py). The game service reads both, so archived games still
+# answer GET /games/<id> and the game list, and user_stats is left as it is.
+# Runs in short batches, so it is safe to run (e.g. daily from cron) while
+# the game service is up. On a database from before finish times were
+# recorded it first adds games.finished_at and finish_position; games finished
+# before that are archived on the first run.
+#
+#   python3 ./bin/archive_games.py [path/to/game.db]
+import sqlite3
+import sys
+import time
+
+import toml
+
+sys.path.append(".")
+import archive
+
+
+def add_column(cur: sqlite3.Cursor, table, column):
+    columns = [row[1] for row in cur.execute(f"PRAGMA table_info({table})")]
+    if column not in columns:
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} INTEGER")
+
+
+def prepare(cur: sqlite3.Cursor):
+    add_column(cur, "games", "finished_at")
+    add_column(cur, "games", "finish_position")
+    with open("./share/archive.sql") as file:
+        cur.executescript(file.read())
+    add_column(cur, "archived_games", "finish_position")
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else "./var/primary/mount/game.db"
+    config = toml.load("./etc/wordle.toml")["ARCHIVE"]
+    connection = sqlite3.connect(path, isolation_level=None)
+    prepare(connection.cursor())
+
+    start = time.perf_counter()
+    moved = archive.archive_games(connection, config["RETAIN_DAYS"], config["BATCH_SIZE"])
+    connection.close()
+    print(
+        f"Archived {moved} games finished more than {config['RETAIN_DAYS']} days ago "
+        f"in {time.perf_counter() - start:.1f}s"
+    )
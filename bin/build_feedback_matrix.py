@@ -0,0 +1,72 @@
+# Precompute the feedback pattern of every valid guess against every secret
+# word for the game service's /candidates and /hint endpoints. Writes a
+# uint8 .npy matrix indexed [correct_word_id, valid_word_id] (column 0
+# unused), about 35 MB, which the game service memory-maps. Row 0 marks the
+# best opening guess with a 1, so workers need not work it out. Run again,
+# and send the game service SIGHUP, whenever bin/word_init.py changes the words.
+#
+#   python3 ./bin/build_feedback_matrix.py [path/to/game.db] [path/to/feedback.npy]
+import os
+import sqlite3
+import sys
+import time
+
+import numpy as np
+import toml
+
+sys.path.append(".")
+import feedback
+from solver import Solver
+from words import WordList
+
+
+def words_by_id(cur: sqlite3.Cursor, table):
+    rows = cur.execute(f"SELECT {table[:-1]}_id, {table[:-1]} FROM {table}").fetchall()
+    # Ids never handed out (row and column 0 included) get a placeholder
+    words = ["aaaaa"] * (max(word_id for word_id, _ in rows) + 1)
+    for word_id, word in rows:
+        words[word_id] = word
+    return words
+
+
+def build(valid_words, correct_words):
+    guesses = feedback.encode_words(valid_words)
+    matrix = np.zeros((len(correct_words), len(valid_words)), dtype=np.uint8)
+    # One secret against every guess at a time; fills a row
+    for secret_id, secret in enumerate(feedback.encode_words(correct_words)):
+        matrix[secret_id] = feedback.patterns(secret, guesses)
+    matrix[0, :] = 0
+    matrix[:, 0] = 0
+    word_list = WordList()
+    word_list.valid_words, word_list.correct_words = valid_words, correct_words
+    word_list.valid_ids = {word: i for i, word in enumerate(valid_words) if i}
+    opening, _ = Solver(matrix, word_list).opening()
+    matrix[0, opening] = 1
+    return matrix
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else "./var/primary/mount/game.db"
+    out = (
+        sys.argv[2]
+        if len(sys.argv) > 2
+        else toml.load("./etc/wordle.toml")["FEEDBACK_MATRIX"]["PATH"]
+    )
+    connection = sqlite3.connect(path)
+    cursor = connection.cursor()
+    valid_words = words_by_id(cursor, "valid_words")
+    correct_words = words_by_id(cursor, "correct_words")
+    connection.close()
+
+    start = time.perf_counter()
+    matrix = build(valid_words, correct_words)
+    # Write a new file and rename it over the old one, so workers that have
+    # the old one mapped keep reading it until they reload
+    tmp = out + ".tmp"
+    with open(tmp, "wb") as file:
+        np.save(file, matrix)
+    os.replace(tmp, out)
+    print(
+        f"Wrote {matrix.shape[0] - 1} x {matrix.shape[1] - 1} patterns to {out} "
+        f"in {time.perf_counter() - start:.1f}s"
+    )
@@ -0,0 +1,66 @@
+# Compact leaderboard data written before game entries expired: every
+# user:<username> hash held every game the user ever reported. Makes sure
+# each user has score:<username> totals, then drops the games that are not
+# indexed under a retained games:<day> set (those are dropped on schedule by
+# the leaderboard service). Scores stay in the totals; only the record used
+# to recognise a re-reported game goes. One user at a time, atomically, so it
+# is safe to run while the leaderboard service is up.
+#
+#   python3 ./bin/compact_leaderboard.py
+import sys
+
+import redis
+import toml
+
+sys.path.append(".")
+from leaderboard import DAYS_KEY
+
+# KEYS: the user's game hash, their totals, then the retained games:<day>
+# sets. ARGV[1]: the username.
+COMPACT_USER_SCRIPT = """
+local games, totals = KEYS[1], KEYS[2]
+local prefix = #ARGV[1] .. ":" .. ARGV[1]
+
+if redis.call("EXISTS", totals) == 0 then
+    local sum = 0
+    local values = redis.call("HVALS", games)
+    for _, value in ipairs(values) do
+        sum = sum + tonumber(value)
+    end
+    redis.call("HSET", totals, "sum", sum, "count", #values)
+end
+
+local removed = 0
+for _, game in ipairs(redis.call("HKEYS", games)) do
+    local retained = false
+    for i = 3, #KEYS do
+        if redis.call("SISMEMBER", KEYS[i], prefix .. game) == 1 then
+            retained = true
+            break
+        end
+    end
+    if not retained then
+        redis.call("HDEL", games, game)
+        removed = removed + 1
+    end
+end
+return removed
+"""
+
+
+def compact(r):
+    script = r.register_script(COMPACT_USER_SCRIPT)
+    users, removed = 0, 0
+    for key in r.scan_iter(match="user:*", count=1000, _type="hash"):
+        days = [b"games:" + day for day in r.zrange(DAYS_KEY, 0, -1)]
+        username = key[len(b"user:") :]
+        removed += script(keys=[key, b"score:" + username, *days], args=[username])
+        users += 1
+    return users, removed
+
+
+if __name__ == "__main__":
+    config = toml.load("./etc/wordle.toml")["REDIS"]
+    r = redis.Redis(host=config["HOST"], port=config["PORT"], db=config["DB"])
+    users, removed = compact(r)
+    print(f"Dropped {removed} old game entries from {users} users")
@@ -5,6 +5,10 @@ import uuid
 import hashlib
 import base64
 import secrets
+import sys
+
+sys.path.append(".")
+import feedback
 
 ALGORITHM = "pbkdf2_sha256"
 
@@ -33,20 +37,22 @@ def insert_into_games(cur: sqlite3.Cursor, username: str):
     ).fetchone()
     length = res[0]
 
-    uuid1 = str(uuid.uuid4())
+    uuid1 = uuid.uuid4()
+    secret_word_id = random.randint(1, length)
 
     cur.execute(
         """
-        INSERT INTO games(game_id, username, secret_word_id, guess_remaining)
+        INSERT INTO games(uuid, username, secret_word_id, guess_remaining)
         VALUES(:uuid, :username, :secret_word_id, :guesses)
         """,
         {
-            "uuid": uuid1,
+            "uuid": uuid1.bytes,
             "username": username,
-            "secret_word_id": random.randint(1, length),
+            "secret_word_id": secret_word_id,
             "guesses": 5 # Set to 5 since we add random guess next
         },
     )
+    game_id = cur.lastrowid
 
     res = cur.execute(
         """
@@ -55,16 +61,27 @@ def insert_into_games(cur: sqlite3.Cursor, username: str):
         """
     ).fetchone()
     length = res[0]
+    valid_word_id = random.randint(1, length)
+
+    secret_word, guess = cur.execute(
+        """
+        SELECT correct_word, valid_word
+        FROM correct_words, valid_words
+        WHERE correct_word_id = :secret_word_id AND valid_word_id = :valid_word_id
+        """,
+        {"secret_word_id": secret_word_id, "valid_word_id": valid_word_id},
+    ).fetchone()
 
     cur.execute(
         """
-        INSERT INTO guesses(game_id, valid_word_id, guess_number)
-        VALUES(:game_id, :valid_word_id, :guess_number)
+        INSERT INTO guesses(game_id, valid_word_id, guess_number, feedback)
+        VALUES(:game_id, :valid_word_id, :guess_number, :feedback)
         """,
         {
-            "game_id": uuid1,
-            "valid_word_id": random.randint(1, length),
+            "game_id": game_id,
+            "valid_word_id": valid_word_id,
             "guess_number": 1,
+            "feedback": feedback.pattern(secret_word, guess),
         },
     )
 
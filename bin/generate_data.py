@@ -0,0 +1,277 @@
+# Generate production-sized user.db and game.db files for performance work:
+# millions of users, games and guesses in realistic proportions. Existing
+# tables in the target files are dropped and rebuilt from ./share.
+#
+#   python3 ./bin/generate_data.py --users 1000000 --seed 449 [--redis]
+import argparse
+import multiprocessing
+import sqlite3
+import sys
+import time
+import uuid
+
+import numpy as np
+import toml
+
+sys.path.append(".")
+sys.path.append("./bin")
+import feedback
+import rebuild_stats
+import word_init
+from game_and_user_init import hash_password
+
+# How many guesses a won game took, 1 to 6
+WIN_GUESSES = [0.01, 0.06, 0.23, 0.33, 0.24, 0.13]
+
+
+def run_script(cur: sqlite3.Cursor, path):
+    with open(path) as file:
+        cur.executescript(file.read())
+
+
+# Hash a handful of distinct passwords in parallel; users share them
+def hash_passwords(count, iterations, workers):
+    passwords = [f"password{i}" for i in range(count)]
+    with multiprocessing.Pool(workers) as pool:
+        hashes = pool.starmap(hash_password, [(p, None, iterations) for p in passwords])
+    return passwords, hashes
+
+
+def generate_users(cur: sqlite3.Cursor, args):
+    run_script(cur, "./share/users.sql")
+    passwords, hashes = hash_passwords(
+        args.distinct_passwords, args.iterations, args.hash_workers
+    )
+    cur.execute("BEGIN")
+    cur.executemany(
+        "INSERT INTO users(username, password) VALUES(?, ?)",
+        ((f"user{i}", hashes[i % len(hashes)]) for i in range(args.users)),
+    )
+    cur.execute("COMMIT")
+    print(
+        f"Generated {args.users} users "
+        f"(user<n> has password password<n % {len(passwords)}>)"
+    )
+
+
+# Drop the indexes on a table before a bulk load, returning the statements
+# that recreate them afterwards
+def drop_indexes(cur: sqlite3.Cursor, tables):
+    rows = cur.execute(
+        f"""
+        SELECT name, sql FROM sqlite_master
+        WHERE type = 'index' AND sql IS NOT NULL
+        AND tbl_name IN ({",".join("?" * len(tables))})
+        """,
+        tables,
+    ).fetchall()
+    for name, _ in rows:
+        cur.execute(f"DROP INDEX {name}")
+    return [sql for _, sql in rows]
+
+
+# One chunk of games: who played them, the secret, the final state and how
+# many guesses are stored (the final winning or losing guess is not stored,
+# matching play_game)
+def generate_chunk(rng, args, first_user, user_count, correct_count):
+    games_per_user = rng.poisson(args.games_per_user, user_count)
+    users = np.repeat(np.arange(first_user, first_user + user_count), games_per_user)
+    count = len(users)
+
+    secrets = rng.integers(1, correct_count + 1, count)
+    state = rng.choice(
+        3,
+        count,
+        p=[
+            args.in_progress,
+            (1 - args.in_progress) * args.win_rate,
+            (1 - args.in_progress) * (1 - args.win_rate),
+        ],
+    )
+    used = np.where(
+        state == 1,
+        rng.choice(np.arange(1, 7), count, p=WIN_GUESSES),
+        np.where(state == 2, 6, rng.integers(0, 6, count)),
+    )
+    stored = np.where(state == 0, used, used - 1)
+    return users, secrets, state, 6 - used, stored
+
+
+def generate_games(cur: sqlite3.Cursor, args, rng):
+    run_script(cur, "./share/words.sql")
+    cur.execute("BEGIN")
+    word_init.populate_words(cur)
+    cur.execute("COMMIT")
+    run_script(cur, "./share/games.sql")
+    run_script(cur, "./share/replication.sql")
+    # Entries for the games just replaced would report games that are gone,
+    # and archived ones would clash with the new game ids
+    run_script(cur, "./share/outbox.sql")
+    cur.execute("DELETE FROM leaderboard_outbox")
+    run_script(cur, "./share/archive.sql")
+    cur.execute("DELETE FROM archived_games")
+
+    correct = [
+        word
+        for (word,) in cur.execute(
+            "SELECT correct_word FROM correct_words ORDER BY correct_word_id"
+        )
+    ]
+    valid = [
+        word
+        for (word,) in cur.execute(
+            "SELECT valid_word FROM valid_words ORDER BY valid_word_id"
+        )
+    ]
+    # Encoded words indexed by id (row 0 unused)
+    encoded_correct = np.vstack([np.zeros(5, np.uint8), feedback.encode_words(correct)])
+    encoded_valid = np.vstack([np.zeros(5, np.uint8), feedback.encode_words(valid)])
+
+    indexes = drop_indexes(cur, ["games", "guesses"])
+    cur.execute("BEGIN")
+    totals = np.zeros(3, dtype=np.int64)
+    guess_total = 0
+    next_id = 1
+    scores = []
+    for first_user in range(0, args.users, args.chunk):
+        user_count = min(args.chunk, args.users - first_user)
+        users, secrets, state, remaining, stored = generate_chunk(
+            rng, args, first_user, user_count, len(correct)
+        )
+        # Seeded UUIDs, so the same seed gives the same database
+        raw = rng.bytes(16 * len(users))
+        uuids = [
+            uuid.UUID(bytes=raw[i : i + 16], version=4).bytes
+            for i in range(0, len(raw), 16)
+        ]
+        game_ids = np.arange(next_id, next_id + len(users))
+        next_id += len(users)
+        cur.executemany(
+            """
+            INSERT INTO games(game_id, uuid, username, secret_word_id, state, guess_remaining)
+            VALUES(?, ?, ?, ?, ?, ?)
+            """,
+            zip(
+                game_ids.tolist(),
+                uuids,
+                (f"user{u}" for u in users.tolist()),
+                secrets.tolist(),
+                state.tolist(),
+                remaining.tolist(),
+            ),
+        )
+
+        # Guesses, scored in one batch; a stored guess is never the secret
+        game_index = np.repeat(np.arange(len(users)), stored)
+        first_guess = np.repeat(np.cumsum(stored) - stored, stored)
+        guess_number = np.arange(len(game_index)) - first_guess + 1
+        guess_secrets = secrets[game_index]
+        guess_ids = rng.integers(1, len(valid) + 1, len(game_index))
+        hits = (encoded_valid[guess_ids] == encoded_correct[guess_secrets]).all(axis=1)
+        guess_ids[hits] = guess_ids[hits] % len(valid) + 1
+        codes = feedback.patterns(encoded_correct[guess_secrets], encoded_valid[guess_ids])
+        cur.executemany(
+            """
+            INSERT INTO guesses(game_id, valid_word_id, guess_number, feedback)
+            VALUES(?, ?, ?, ?)
+            """,
+            zip(
+                game_ids[game_index].tolist(),
+                guess_ids.tolist(),
+                guess_number.tolist(),
+                codes.tolist(),
+            ),
+        )
+
+        totals += np.bincount(state, minlength=3)
+        guess_total += len(game_index)
+        if args.redis:
+            finished = np.flatnonzero(state != 0)
+            scores.append(
+                (
+                    users[finished],
+                    [str(uuid.UUID(bytes=uuids[i])) for i in finished.tolist()],
+                    state[finished],
+                    6 - remaining[finished],
+                )
+            )
+        print(f"  {first_user + user_count} users, {int(totals.sum())} games, {guess_total} guesses")
+
+    print("Building indexes")
+    for sql in indexes:
+        cur.execute(sql)
+    rebuild_stats.rebuild(cur)
+    cur.execute("COMMIT")
+    print(
+        f"Generated {int(totals.sum())} games ({totals[0]} in progress, "
+        f"{totals[1]} won, {totals[2]} lost) and {guess_total} guesses"
+    )
+    return scores
+
+
+# Fill the Redis leaderboard with every finished game, in the layout
+# leaderboard.py uses: score:<name> totals and the leaderboard sorted set of
+# mean scores. The games are treated as older than [LEADERBOARD] RETAIN_DAYS,
+# so they get no per-game entries and are not in the daily or weekly windows.
+def fill_leaderboard(scores):
+    import redis
+    from leaderboard import calculate_score
+
+    config = toml.load("./etc/wordle.toml")["REDIS"]
+    r = redis.Redis(host=config["HOST"], port=config["PORT"], db=config["DB"])
+    sums, counts = {}, {}
+    pipe = r.pipeline(transaction=False)
+    for users, _, state, guesses in scores:
+        for user, won, number in zip(
+            users.tolist(), (state == 1).tolist(), guesses.tolist()
+        ):
+            score = calculate_score(won, number)
+            sums[user] = sums.get(user, 0) + score
+            counts[user] = counts.get(user, 0) + 1
+    for user, total in sums.items():
+        pipe.hset(f"score:user{user}", mapping={"sum": total, "count": counts[user]})
+        pipe.zadd("leaderboard", {f"user:user{user}": total / counts[user]})
+        if len(pipe) >= 10000:
+            pipe.execute()
+    # Tells the leaderboard service its cached ranks are out of date
+    pipe.incr("leaderboard:version")
+    pipe.execute()
+    print(f"Filled the leaderboard with {len(sums)} users")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate benchmark databases")
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--games-per-user", type=float, default=5.0, help="mean")
+    parser.add_argument("--in-progress", type=float, default=0.15, help="share of games")
+    parser.add_argument("--win-rate", type=float, default=0.85, help="of finished games")
+    parser.add_argument("--seed", type=int, default=449)
+    parser.add_argument("--distinct-passwords", type=int, default=64)
+    parser.add_argument("--iterations", type=int, default=260000, help="PBKDF2")
+    parser.add_argument("--hash-workers", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--chunk", type=int, default=50000, help="users per batch")
+    parser.add_argument("--user-db", default="./var/user.db")
+    parser.add_argument("--game-db", default="./var/primary/mount/game.db")
+    parser.add_argument("--redis", action="store_true", help="also fill the leaderboard")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    start = time.perf_counter()
+
+    user_con = sqlite3.connect(args.user_db, isolation_level=None)
+    user_con.execute("PRAGMA synchronous = OFF")
+    generate_users(user_con.cursor(), args)
+    user_con.close()
+
+    game_con = sqlite3.connect(args.game_db, isolation_level=None)
+    game_con.execute("PRAGMA synchronous = OFF")
+    scores = generate_games(game_con.cursor(), args, rng)
+    game_con.close()
+
+    if args.redis:
+        fill_leaderboard(scores)
+    print(f"Done in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,11 +8,19 @@ sqlite3 ./var/primary/mount/game.db  < ./share/words.sql
 # insert values in valid_words and correct_words tables from json files
 python3 ./bin/word_init.py
 
+# precompute every guess's feedback against every secret for hints
+python3 ./bin/build_feedback_matrix.py
+
 # create other tables required for storing user information and playing the wordle game
 sqlite3 ./var/primary/mount/game.db  < ./share/games.sql
+sqlite3 ./var/primary/mount/game.db  < ./share/replication.sql
+sqlite3 ./var/primary/mount/game.db  < ./share/stats.sql
+sqlite3 ./var/primary/mount/game.db  < ./share/outbox.sql
+sqlite3 ./var/primary/mount/game.db  < ./share/archive.sql
 
 # populate the user and games table with dummy values
 python3 ./bin/game_and_user_init.py
+python3 ./bin/rebuild_stats.py
 
 # Flush the Redis Database to prep for the leaderboard db
 echo "Preparing the Leaderboard DB."
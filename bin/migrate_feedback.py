@@ -0,0 +1,59 @@
+# Add the guesses.feedback column to an existing game.db and backfill it.
+# Safe to run more than once; only rows without feedback are scored.
+#
+#   python3 ./bin/migrate_feedback.py [path/to/game.db]
+import sqlite3
+import sys
+
+sys.path.append(".")
+import feedback
+
+
+def migrate(cur: sqlite3.Cursor):
+    columns = [row[1] for row in cur.execute("PRAGMA table_info(guesses)")]
+    if "feedback" not in columns:
+        cur.execute("ALTER TABLE guesses ADD COLUMN feedback INTEGER")
+
+    rows = cur.execute(
+        """
+        SELECT guesses.game_id, guess_number, correct_word, valid_word
+        FROM guesses
+        JOIN games ON games.game_id = guesses.game_id
+        JOIN correct_words ON correct_word_id = games.secret_word_id
+        JOIN valid_words ON valid_words.valid_word_id = guesses.valid_word_id
+        WHERE feedback IS NULL
+        """
+    ).fetchall()
+    cur.executemany(
+        "UPDATE guesses SET feedback = ? WHERE game_id = ? AND guess_number = ?",
+        [
+            (feedback.pattern(secret, guess), game_id, guess_number)
+            for game_id, guess_number, secret, guess in rows
+        ],
+    )
+
+    # The compact layout (bin/migrate_layout.py) clusters guesses by game
+    if "uuid" in [row[1] for row in cur.execute("PRAGMA table_info(games)")]:
+        return len(rows)
+
+    # Rebuild the index so that history reads are covered by it
+    cur.execute("DROP INDEX IF EXISTS guesses_idx_idnumber")
+    cur.execute(
+        """
+        CREATE INDEX guesses_idx_idnumber
+        ON guesses(game_id, guess_number, valid_word_id, feedback)
+        """
+    )
+    return len(rows)
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else "./var/primary/mount/game.db"
+    connection = sqlite3.connect(path, isolation_level=None)
+    cursor = connection.cursor()
+
+    cursor.execute("BEGIN IMMEDIATE")
+    count = migrate(cursor)
+    cursor.execute("COMMIT")
+    connection.close()
+    print(f"Backfilled feedback for {count} guesses")
@@ -0,0 +1,105 @@
+# Convert an existing game.db to the compact layout in share/games.sql:
+# games keyed by an integer game_id with the public UUID stored as 16 bytes,
+# and guesses clustered by (game_id, guess_number) in a WITHOUT ROWID table.
+# Games keep their creation order. Runs in one transaction, then VACUUMs to
+# return the freed pages. Safe to run more than once.
+#
+#   python3 ./bin/migrate_layout.py [path/to/game.db]
+import sqlite3
+import sys
+import uuid
+
+
+def columns(cur: sqlite3.Cursor, table):
+    return [row[1] for row in cur.execute(f"PRAGMA table_info({table})")]
+
+
+def migrate(cur: sqlite3.Cursor):
+    if "uuid" in columns(cur, "games"):
+        return None
+    # Databases from before bin/migrate_feedback.py have no feedback yet
+    feedback = "old.feedback" if "feedback" in columns(cur, "guesses") else "NULL"
+
+    cur.execute("ALTER TABLE guesses RENAME TO guesses_old")
+    cur.execute("ALTER TABLE games RENAME TO games_old")
+    cur.execute("DROP INDEX IF EXISTS games_idx_usernamestate")
+    cur.execute("DROP INDEX IF EXISTS guesses_idx_idnumber")
+
+    # Same tables as share/games.sql
+    cur.execute(
+        """
+        CREATE TABLE games (
+            game_id INTEGER PRIMARY KEY,
+            uuid BLOB NOT NULL UNIQUE,
+            username VARCHAR NOT NULL,
+            secret_word_id INTEGER NOT NULL,
+            state INTEGER DEFAULT 0,
+            guess_remaining INTEGER DEFAULT 6,
+            finished_at INTEGER,
+            finish_position INTEGER,
+            FOREIGN KEY(secret_word_id) REFERENCES correct_words(correct_word_id)
+        )
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE guesses(
+            game_id INTEGER NOT NULL,
+            guess_number INTEGER NOT NULL,
+            valid_word_id INTEGER NULL,
+            feedback INTEGER,
+            PRIMARY KEY(game_id, guess_number),
+            FOREIGN KEY(game_id) REFERENCES games(game_id),
+            FOREIGN KEY(valid_word_id) REFERENCES valid_words(valid_word_id)
+        ) WITHOUT ROWID
+        """
+    )
+
+    cur.execute(
+        """
+        INSERT INTO games(uuid, username, secret_word_id, state, guess_remaining)
+        SELECT uuid_bytes(game_id), username, secret_word_id, state, guess_remaining
+        FROM games_old ORDER BY rowid
+        """
+    )
+    games = cur.rowcount
+    # A game can only have one guess per number; keep the first if not
+    cur.execute(
+        f"""
+        INSERT OR IGNORE INTO guesses(game_id, guess_number, valid_word_id, feedback)
+        SELECT games.game_id, old.guess_number, old.valid_word_id, {feedback}
+        FROM guesses_old AS old
+        JOIN games ON games.uuid = uuid_bytes(old.game_id)
+        ORDER BY games.game_id, old.guess_number, old.guess_id
+        """
+    )
+    guesses = cur.rowcount
+
+    cur.execute("DROP TABLE guesses_old")
+    cur.execute("DROP TABLE games_old")
+    cur.execute("CREATE INDEX games_idx_usernamestate ON games(username, state)")
+    return games, guesses
+
+
+def open_database(path):
+    connection = sqlite3.connect(path, isolation_level=None)
+    connection.create_function(
+        "uuid_bytes", 1, lambda value: uuid.UUID(value).bytes, deterministic=True
+    )
+    return connection
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else "./var/primary/mount/game.db"
+    connection = open_database(path)
+    cursor = connection.cursor()
+
+    cursor.execute("BEGIN IMMEDIATE")
+    result = migrate(cursor)
+    cursor.execute("COMMIT")
+    if result is None:
+        print("Already migrated")
+    else:
+        cursor.execute("VACUUM")
+        print("Migrated {} games and {} guesses".format(*result))
+    connection.close()
@@ -0,0 +1,25 @@
+# Create the leaderboard outbox tables in an existing game.db, adding the
+# attempts column to an outbox from before entries were given up on. Safe to
+# run more than once.
+#
+#   python3 ./bin/migrate_outbox.py [path/to/game.db]
+import sqlite3
+import sys
+
+
+def migrate(cur: sqlite3.Cursor):
+    columns = [row[1] for row in cur.execute("PRAGMA table_info(leaderboard_outbox)")]
+    if columns and "attempts" not in columns:
+        cur.execute(
+            "ALTER TABLE leaderboard_outbox ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0"
+        )
+    with open("./share/outbox.sql") as file:
+        cur.executescript(file.read())
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else "./var/primary/mount/game.db"
+    connection = sqlite3.connect(path, isolation_level=None)
+    migrate(connection.cursor())
+    connection.close()
+    print("Leaderboard outbox is up to date")
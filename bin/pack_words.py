@@ -0,0 +1,32 @@
+# Pack share/correct.json and share/valid.json into share/words.bin (see
+# words.py for the format), which bin/word_init.py and the game service load
+# instead of parsing the JSON. Ids are assigned as they always have been:
+# correct words in file order, and valid words followed by the correct words
+# (so that every secret can be guessed). Run again if the JSON changes.
+#
+#   python3 ./bin/pack_words.py [path/to/words.bin]
+import json
+import os
+import sys
+
+sys.path.append(".")
+import words
+
+
+def load_json():
+    with open("./share/correct.json") as file:
+        correct = json.load(file)
+    with open("./share/valid.json") as file:
+        valid = json.load(file)
+    return correct, valid + correct
+
+
+if __name__ == "__main__":
+    out = sys.argv[1] if len(sys.argv) > 1 else "./share/words.bin"
+    correct, valid = load_json()
+    data = words.pack(correct, valid)
+    tmp = out + ".tmp"
+    with open(tmp, "wb") as file:
+        file.write(data)
+    os.replace(tmp, out)
+    print(f"Packed {len(correct)} correct and {len(valid)} valid words into {out}")
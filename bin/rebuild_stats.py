@@ -0,0 +1,91 @@
+# Recompute the user_stats table from games and archived_games, creating it
+# if needed. Run it after loading games outside the game service, or if the
+# tables ever disagree.
+# Streaks follow the order games finished in, as the game service counts
+# them: by finish_position, the replication position of the guess that ended
+# each game. Games finished before it was recorded come first, by finished_at
+# and then game_id.
+#
+#   python3 ./bin/rebuild_stats.py [path/to/game.db]
+import sqlite3
+import sys
+
+
+def empty_stats():
+    return {
+        "in_progress": 0,
+        "wins": 0,
+        "losses": 0,
+        "guesses": [0] * 6,
+        "current_streak": 0,
+        "max_streak": 0,
+    }
+
+
+def rebuild(cur: sqlite3.Cursor):
+    with open("./share/stats.sql") as file:
+        cur.execute(file.read())
+    cur.execute("DELETE FROM user_stats")
+
+    stats = {}
+    # Archived games (./bin/archive_games.py) count too
+    rows = cur.execute(
+        """
+        SELECT username, state, guess_remaining, finish_position, finished_at, game_id
+        FROM games
+        UNION ALL
+        SELECT username, state, guess_remaining, finish_position, finished_at, game_id
+        FROM archived_games
+        ORDER BY username, finish_position, finished_at, game_id
+        """
+    )
+    for username, state, guess_remaining, _, _, _ in rows:
+        user = stats.get(username)
+        if user is None:
+            user = stats[username] = empty_stats()
+        if state == 0:
+            user["in_progress"] += 1
+        elif state == 1:
+            user["wins"] += 1
+            user["guesses"][5 - guess_remaining] += 1
+            user["current_streak"] += 1
+            user["max_streak"] = max(user["max_streak"], user["current_streak"])
+        else:
+            user["losses"] += 1
+            user["current_streak"] = 0
+
+    cur.executemany(
+        """
+        INSERT INTO user_stats(
+            username, in_progress, wins, losses,
+            guesses_1, guesses_2, guesses_3, guesses_4, guesses_5, guesses_6,
+            current_streak, max_streak
+        )
+        VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        (
+            (
+                username,
+                user["in_progress"],
+                user["wins"],
+                user["losses"],
+                *user["guesses"],
+                user["current_streak"],
+                user["max_streak"],
+            )
+            for username, user in stats.items()
+        ),
+    )
+    return len(stats)
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else "./var/primary/mount/game.db"
+    connection = sqlite3.connect(path, isolation_level=None)
+    cursor = connection.cursor()
+
+    cursor.execute("BEGIN IMMEDIATE")
+    count = rebuild(cursor)
+    cursor.execute("COMMIT")
+    connection.close()
+    print(f"Rebuilt statistics for {count} users")
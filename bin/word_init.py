@@ -1,33 +1,34 @@
 # Imports
-import json
 import sqlite3
+import sys
 
+sys.path.append(".")
+import words
 
-def populate_words(cur: sqlite3.Cursor):
+PACKED_WORDS = "./share/words.bin"
+
+
+def populate_words(cur: sqlite3.Cursor, path=PACKED_WORDS):
+    packed = words.PackedWords(path)
 
     # Make sure tables are empty first
     cur.execute("DELETE from correct_words")
     cur.execute("DELETE from valid_words")
-
-    with open("./share/correct.json") as file:
-        correctWordList = json.load(file)
-
-    with open("./share/valid.json") as file:
-        validWordList = json.load(file)
-
-
-    correctWordList = [(word,) for word in correctWordList]
-    validWordList = [(word,) for word in validWordList]
-
-    # Simple fix for not allowing correct words to be guessed
-    validWordList.extend(correctWordList)
-
-    cur.executemany("INSERT INTO correct_words(correct_word) values(?)", correctWordList)
-    cur.executemany("INSERT INTO valid_words(valid_word) values(?)", validWordList)
-    
-    return len(correctWordList) + len(validWordList)
-
-
+    cur.execute("DELETE from word_lists")
+
+    # Ids come from the file, so they match the game service's view of it
+    cur.executemany(
+        "INSERT INTO correct_words(correct_word_id, correct_word) values(?, ?)",
+        ((i, word.decode("ascii")) for i, word in enumerate(packed.correct, 1)),
+    )
+    cur.executemany(
+        "INSERT INTO valid_words(valid_word_id, valid_word) values(?, ?)",
+        ((i, word.decode("ascii")) for i, word in enumerate(packed.valid, 1)),
+    )
+    # Lets the game service know it can use the file instead of the tables
+    cur.execute("INSERT INTO word_lists(checksum) values(?)", (packed.checksum,))
+
+    return len(packed.correct) + len(packed.valid)
 
 
 if __name__ == "__main__":
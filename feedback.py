@@ -0,0 +1,88 @@
+# Imports
+import numpy as np
+
+# A guess is scored as one base-3 digit per position, position 1 being the
+# least significant: 0 = letter absent, 1 = wrong position, 2 = correct.
+ABSENT, PRESENT, CORRECT = 0, 1, 2
+WORD_LENGTH = 5
+POWERS = tuple(3**i for i in range(WORD_LENGTH))
+ALL_CORRECT = sum(CORRECT * power for power in POWERS)
+
+# code -> digit per position, for decoding without arithmetic
+DIGITS = tuple(
+    tuple((code // power) % 3 for power in POWERS) for code in range(3**WORD_LENGTH)
+)
+
+
+# Pattern code for a single (secret, guess) pair. Letters matched in place
+# are removed from the secret first; remaining guess letters are then matched
+# left to right against what is left, so duplicates are never over-counted.
+def pattern(secret_word, guess):
+    remaining = {}
+    for secret_letter, guess_letter in zip(secret_word, guess):
+        if secret_letter != guess_letter:
+            remaining[secret_letter] = remaining.get(secret_letter, 0) + 1
+
+    code = 0
+    for i, (secret_letter, guess_letter) in enumerate(zip(secret_word, guess)):
+        if secret_letter == guess_letter:
+            code += CORRECT * POWERS[i]
+        elif remaining.get(guess_letter):
+            remaining[guess_letter] -= 1
+            code += PRESENT * POWERS[i]
+    return code
+
+
+# Expand a pattern code into the (position, letter) lists the API returns
+def decode(code, guess):
+    correct_positions = []
+    incorrect_positions = []
+    for i, digit in enumerate(DIGITS[code]):
+        if digit == CORRECT:
+            correct_positions.append((i + 1, guess[i]))
+        elif digit == PRESENT:
+            incorrect_positions.append((i + 1, guess[i]))
+    return correct_positions, incorrect_positions
+
+
+# Function to compare the guess to answer.
+def compare(secret_word, guess):
+    return decode(pattern(secret_word, guess), guess)
+
+
+# Encode lowercase words as an (n, 5) array of letter indexes 0-25
+def encode_words(words):
+    joined = "".join(words)
+    if len(joined) != WORD_LENGTH * len(words) or not (
+        joined.isascii() and joined.isalpha() and joined.islower()
+    ):
+        raise ValueError("Words must be five lowercase letters a-z")
+    letters = np.frombuffer(joined.encode("ascii"), dtype=np.uint8)
+    return (letters - ord("a")).reshape(-1, WORD_LENGTH)
+
+
+# Batched pattern codes. `secrets` and `guesses` are encoded words, either a
+# single (5,) word or an (n, 5) array; they broadcast against each other, so
+# one secret can be scored against many guesses or many secrets against one
+# guess in a single call. Returns a uint8 array of codes.
+def patterns(secrets, guesses):
+    secrets, guesses = np.broadcast_arrays(
+        np.atleast_2d(secrets), np.atleast_2d(guesses)
+    )
+    rows = np.arange(len(secrets))
+    correct = secrets == guesses
+
+    # Per row, how many of each letter the secret has outside correct positions
+    remaining = np.zeros((len(secrets), 26), dtype=np.int8)
+    for i in range(WORD_LENGTH):
+        remaining[rows, secrets[:, i]] += ~correct[:, i]
+
+    codes = np.zeros(len(secrets), dtype=np.uint8)
+    for i in range(WORD_LENGTH):
+        letters = guesses[:, i]
+        present = ~correct[:, i] & (remaining[rows, letters] > 0)
+        remaining[rows, letters] -= present
+        codes += POWERS[i] * (CORRECT * correct[:, i] + PRESENT * present).astype(
+            np.uint8
+        )
+    return codes
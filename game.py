@@ -1,11 +1,30 @@
 # Imports
 import dataclasses
-import random
 import textwrap
 import uuid
-import databases
 import toml
-import itertools
+import signal
+import time
+import asyncio
+import collections
+import base64
+import json
+import urllib.parse
+from pool import GroupCommit, Pool
+from metrics import Metrics, instrument
+from words import WordList
+from gamecache import CachedGame, GameCache
+from solver import Solver
+from outbox import OutboxDrainer, post_entries, queue_entry
+import feedback
+from replicas import (
+    POSITION_COOKIE,
+    POSITION_HEADER,
+    Replica,
+    ReplicaSet,
+    bump_position,
+    client_position,
+)
 from quart import Quart, g, request, abort, jsonify
 from quart_schema import (
     QuartSchema,
@@ -31,16 +50,88 @@ QuartSchema(
             "description": "APIs for checking game statistics for a user",
         },
         {"name": "Root", "description": "Root path returning html"},
+        {
+            "name": "Replication",
+            "description": "APIs for checking how reads are routed to replicas",
+        },
     ],
 )
 app.config.from_file(f"./etc/wordle.toml", toml.load)
 
-replica_dbs = [
-    app.config["DATABASES"]["GAME_PRIMARY_URL"],
-    app.config["DATABASES"]["GAME_SECONDARY1_URL"],
-    app.config["DATABASES"]["GAME_SECONDARY2_URL"],
-]
-replica_db_buffer = itertools.cycle(replica_dbs)
+# Opt-in Prometheus metrics, served on /metrics when [METRICS] ENABLED
+metrics = Metrics(app.config["METRICS"]["ENABLED"])
+instrument(app, metrics)
+metrics.callback(
+    "wordle_replica_reads_total",
+    "counter",
+    "Reads by route: untracked, replica, waited (for a replica to catch up) or primary",
+    lambda: [({"route": route}, count) for route, count in replica_set.routes.items()],
+)
+metrics.callback(
+    "wordle_replica_lag",
+    "gauge",
+    "Writes each replica is behind the primary",
+    lambda: [({"url": r.url}, r.lag) for r in replica_set.replicas],
+)
+metrics.callback(
+    "wordle_replica_healthy",
+    "gauge",
+    "Whether each replica is in the read pool",
+    lambda: [({"url": r.url}, int(r.healthy)) for r in replica_set.replicas],
+)
+
+replica_set = None
+
+# Long-lived connection pools, one per database URL
+pools = {}
+
+# valid_words and correct_words, loaded once at startup
+word_list = WordList()
+
+# Commits created games and guesses together, when [GROUP_COMMIT] is enabled
+group_commit = None
+metrics.callback(
+    "wordle_group_commit_total",
+    "counter",
+    "Group commit batches, and writes committed, rolled back or failed with their batch",
+    lambda: [
+        ({"result": result}, count)
+        for result, count in (group_commit.counts.items() if group_commit else [])
+    ],
+)
+
+# Ships finished games from the outbox table to the leaderboard service
+outbox_drainer = None
+metrics.callback(
+    "wordle_outbox_total",
+    "counter",
+    "Leaderboard outbox entries sent, batches sent, batches that failed and entries given up on",
+    lambda: [
+        ({"result": result}, count)
+        for result, count in (outbox_drainer.counts.items() if outbox_drainer else [])
+    ],
+)
+
+# Precomputed feedback matrix for /candidates and /hint, or None if it has
+# not been built (bin/build_feedback_matrix.py) or no longer matches the words
+solver = None
+
+# Recently used in-progress games, written through after every commit
+game_cache = GameCache(
+    app.config["GAME_CACHE"]["SIZE"], app.config["GAME_CACHE"]["TTL"]
+)
+metrics.callback(
+    "wordle_game_cache_total",
+    "counter",
+    "Game cache lookups by result (hit, miss, expired, behind) and evictions",
+    lambda: [({"result": result}, count) for result, count in game_cache.counts.items()],
+)
+metrics.callback(
+    "wordle_game_cache_entries",
+    "gauge",
+    "Games in the game cache",
+    lambda: [({}, len(game_cache))],
+)
 
 
 @dataclasses.dataclass
@@ -48,36 +139,154 @@ class Word:
     guess: str
 
 
-# Establish database connection
+# Open the connection pools once for the lifetime of the process
+@app.before_serving
+async def open_pools():
+    global replica_set, outbox_drainer, group_commit
+    replica_dbs = [
+        app.config["DATABASES"]["GAME_SECONDARY1_URL"],
+        app.config["DATABASES"]["GAME_SECONDARY2_URL"],
+    ]
+    for url in [app.config["DATABASES"]["GAME_URL"], *replica_dbs]:
+        if url not in pools:
+            pool = Pool(
+                url,
+                size=app.config["POOL"]["SIZE"],
+                statement_cache=app.config["POOL"]["STATEMENT_CACHE"],
+                metrics=metrics,
+                streams=app.config["GAMES_LIST"]["MAX_STREAMS"],
+            )
+            await pool.connect()
+            pools[url] = pool
+    config = app.config["REPLICAS"]
+    primary = Replica(
+        pools[app.config["DATABASES"]["GAME_URL"]],
+        weight=config["PRIMARY_WEIGHT"] or 1.0,
+        alpha=config["EWMA_ALPHA"],
+    )
+    replicas = [Replica(pools[url], alpha=config["EWMA_ALPHA"]) for url in replica_dbs]
+    # A weight of 0 keeps reads off the primary unless no replica can serve them
+    if config["PRIMARY_WEIGHT"] > 0:
+        replicas.append(primary)
+    replica_set = ReplicaSet(
+        primary,
+        replicas,
+        wait=app.config["READ_YOUR_WRITES"]["WAIT_MS"] / 1000,
+        poll=app.config["READ_YOUR_WRITES"]["POLL_MS"] / 1000,
+        interval=config["HEALTH_CHECK_MS"] / 1000,
+        max_lag=config["MAX_LAG"],
+        max_failures=config["MAX_FAILURES"],
+    )
+    await replica_set.check()
+    replica_set.start()
+
+    config = app.config["GROUP_COMMIT"]
+    if config["ENABLED"]:
+        group_commit = GroupCommit(
+            await _get_db(), batch=config["BATCH_SIZE"], window=config["WINDOW_MS"] / 1000
+        )
+
+    config = app.config["OUTBOX"]
+    if config["DRAIN"]:
+        outbox_drainer = OutboxDrainer(
+            await _get_db(),
+            lambda entries: post_entries(config["URL"], entries),
+            batch=config["BATCH_SIZE"],
+            interval=config["FLUSH_MS"] / 1000,
+            lease=config["LEASE"],
+            max_attempts=config["MAX_ATTEMPTS"],
+            logger=app.logger,
+        )
+        outbox_drainer.start()
+
+    await reload_words()
+    asyncio.get_running_loop().add_signal_handler(
+        signal.SIGHUP, lambda: asyncio.ensure_future(reload_words())
+    )
+
+
+# Reload the word lists, e.g. after bin/word_init.py (or `kill -HUP <pid>`).
+# Uses share/words.bin when the database was filled from it.
+async def reload_words():
+    global solver
+    count = await word_list.load(await _get_db(), app.config["WORDS"]["PATH"])
+    app.logger.info("Loaded %d words (%s)", count, word_list.source)
+    path = app.config["FEEDBACK_MATRIX"]["PATH"]
+    try:
+        # Off the event loop: an old matrix has its opening guess worked out
+        solver = await asyncio.get_running_loop().run_in_executor(
+            None, Solver.load, path, word_list, app.config["FEEDBACK_MATRIX"]["HINT_SAMPLE"]
+        )
+    except (OSError, ValueError) as e:
+        solver = None
+        app.logger.warning("Hints disabled, cannot use %s: %s", path, e)
+
+
+# Close the connection pools on shutdown
+@app.after_serving
+async def close_pools():
+    global group_commit
+    await replica_set.stop()
+    if group_commit is not None:
+        await group_commit.stop()
+        group_commit = None
+    if outbox_drainer is not None:
+        await outbox_drainer.stop()
+    for pool in pools.values():
+        await pool.disconnect()
+    pools.clear()
+
+
+# Get the primary (read-write) database
 async def _get_db():
-    db = getattr(g, "_primary_db", None)
-    if db is None:
-        db = g._sqlite_db = databases.Database(app.config["DATABASES"]["GAME_URL"])
-        await db.connect()
-    return db
+    return pools[app.config["DATABASES"]["GAME_URL"]]
+
+
+# Where game writes are committed: the group commit batcher if enabled,
+# otherwise a transaction of their own on the primary
+async def _get_writer():
+    return group_commit or await _get_db()
 
 
-# Establish READ-ONLY database connection (this cycles through replica dbs only)
+# Get a READ-ONLY database (the fastest healthy replica, once per request).
+# If the client sent the position of its last write, the replica chosen has
+# already applied that write.
 async def _get_read_db():
     db = getattr(g, "_replica_db", None)
     if db is None:
-        db_url = next(replica_db_buffer)
-        print("Accessing Replica DB: " + db_url)
-        db = g._sqlite_db = databases.Database(db_url)
-        await db.connect()
+        db = g._replica_db = await replica_set.choose(client_position(request))
     return db
 
 
-# Terminate database connection
-@app.teardown_appcontext
-async def close_connection(exception):
-    db = getattr(g, "_primary_db", None)
-    if db is not None:
-        await db.disconnect()
-
-    db = getattr(g, "_replica_db", None)
-    if db is not None:
-        await db.disconnect()
+# The solver for hint endpoints, or 503 if the matrix is missing
+def _get_solver():
+    if solver is None:
+        abort(503, "Hints are unavailable: the feedback matrix has not been built")
+    return solver
+
+
+# The authenticated user. Behind nginx this comes from the /auth subrequest
+# (which accepts Basic auth or a token); called directly, from Basic auth.
+def _get_username():
+    username = request.headers.get("X-Auth-User")
+    if username:
+        return username
+    if request.authorization is None:
+        abort(401)
+    return request.authorization.username
+
+
+# Hand the position of this request's write back to the client, so its next
+# reads can be routed to a replica that has caught up
+@app.after_request
+async def set_replication_position(response):
+    position = getattr(g, "_write_position", None)
+    if position is not None:
+        response.headers[POSITION_HEADER] = str(position)
+        response.set_cookie(
+            POSITION_COOKIE, str(position), httponly=True, samesite="Lax"
+        )
+    return response
 
 
 @tag(["Root"])
@@ -96,32 +305,47 @@ async def index():
 @app.route("/games", methods=["POST"])
 async def create_game():
     """Create a game"""
-    read_db = await _get_read_db()
-    username = request.authorization.username
+    username = _get_username()
+    uuid1 = uuid.uuid4()
 
-    # Open a file and load json from it
-    res = await read_db.fetch_one(
-        """
-        SELECT count(*) count FROM correct_words
-        """
+    writer = await _get_writer()
+    secret_word_id = word_list.random_secret_id()
+    game_id, g._write_position = await writer.transaction(
+        insert_game, uuid1.bytes, username, secret_word_id
+    )
+    game_cache.put(
+        uuid1.bytes,
+        CachedGame(
+            game_id=game_id,
+            username=username,
+            secret_word_id=secret_word_id,
+            guess_remaining=6,
+            state=0,
+            guesses=(),
+            position=g._write_position,
+        ),
     )
-    length = res.count
-    uuid1 = str(uuid.uuid4())
 
-    db = await _get_db()
-    game_id = await db.execute(
+    return {"game_id": str(uuid1), "message": "Game Successfully Created"}, 200
+
+
+def insert_game(connection, game_uuid, username, secret_word_id):
+    connection.execute(
         """
-        INSERT INTO games(game_id, username, secret_word_id) 
+        INSERT INTO games(uuid, username, secret_word_id) 
         VALUES(:uuid, :user, :secret_word_id) 
         """,
-        values={
-            "uuid": uuid1,
-            "user": username,
-            "secret_word_id": random.randint(1, length),
-        },
+        {"uuid": game_uuid, "user": username, "secret_word_id": secret_word_id},
     )
-
-    return {"game_id": uuid1, "message": "Game Successfully Created"}, 200
+    game_id = connection.execute("SELECT last_insert_rowid()").fetchone()[0]
+    connection.execute(
+        """
+        INSERT INTO user_stats(username, in_progress) VALUES(:user, 1)
+        ON CONFLICT(username) DO UPDATE SET in_progress = in_progress + 1
+        """,
+        {"user": username},
+    )
+    return game_id, bump_position(connection)
 
 
 @validate_request(Word)
@@ -130,252 +354,556 @@ async def create_game():
 async def play_game(game_id):
     """Play the game (creating a guess)"""
     data = await request.json
-    read_db = await _get_read_db()
-    write_db = await _get_db()
-
-    username = request.authorization.username
-
-    game_output = await get_game_info(game_id, username)
-    secret_word = game_output["secret_word"]
-    guess_remaining = game_output["guess_remaining"]
-    state = game_output["state"]
+    writer = await _get_writer()
 
+    username = _get_username()
     guess = data["guess"]
 
     if len(guess) != 5:
         abort(400, "Bad Request: Word length should be 5")
-    # when the user guessed the correct word
-    if guess == secret_word:
-        state = 1
 
-    valid_word_output = await read_db.fetch_one(
-        """
-        SELECT valid_word_id
-        FROM valid_words 
-        WHERE valid_word =:word
-        """,
-        values={"word": guess},
-    )
-    if not valid_word_output:
-        if not state:
-            abort(400, "Bad Request: Not a valid guess")
-
-    # Now that we know its a valid request grab the list of prev guesses
-    guess_list = await get_guesses(game_id, secret_word)
-
-    # Decrement the guess remaining
-    guess_remaining -= 1
-
-    # Game is over, update the game
-    if guess_remaining == 0 or state:
-        # user lost the game
-        if state == 0:
-            state = 2
-
-        await write_db.execute(
-            """
-            UPDATE games 
-            SET guess_remaining=:guess_remaining, state=:state
-            WHERE game_id=:game_id
-            """,
-            values={
-                "guess_remaining": guess_remaining,
-                "game_id": game_id,
-                "state": state,
-            },
+    game_uuid = parse_game_id(game_id)
+    cached = game_cache.get(game_uuid)
+    if cached is not None and cached.username != username:
+        cached = None
+
+    try:
+        result = await writer.transaction(
+            commit_guess,
+            game_uuid,
+            username,
+            guess,
+            word_list.valid_word_id(guess),
+            cached,
         )
+    except Exception:
+        game_cache.discard(game_uuid)
+        raise
+    # Write-through, now that the guess is committed
+    if result["game"] is None:
+        game_cache.discard(game_uuid)
+    else:
+        game_cache.put(game_uuid, result["game"])
+    g._write_position = result["position"]
+    state = result["state"]
+    guess_remaining = result["guess_remaining"]
+
+    # Game is over
+    if state:
         return {
             "game_id": game_id,
             "number_of_guesses": 6 - guess_remaining,
             "game_state": STATES[state],
         }, 200
-    else:
-        await write_db.execute(
-            """
-            UPDATE games
-            SET guess_remaining=:guess_remaining
-            WHERE game_id=:game_id
-            """,
-            values={"guess_remaining": guess_remaining, "game_id": game_id},
-        )
-
-        guess_number = 6 - guess_remaining
-        valid_word_id = valid_word_output.valid_word_id
-        await write_db.execute(
-            """
-            INSERT INTO guesses(game_id, valid_word_id, guess_number)
-            VALUES(:game_id, :valid_word_id, :guess_number)
-            """,
-            values={
-                "game_id": game_id,
-                "valid_word_id": valid_word_id,
-                "guess_number": guess_number,
-            },
-        )
-        # Add newest guess to end of list
-        correct_positions, incorrect_positions = compare(secret_word, guess)
-        guess_list.append(
-            {
-                "guess": guess,
-                "guess_number": guess_number,
-                "correct_positions": dict(correct_positions),
-                "incorrect_positions:": dict(incorrect_positions),
-            }
-        )
 
     return {
-        "guesses": guess_list,
+        "guesses": result["guesses"],
         "guess_remaining": guess_remaining,
         "game_state": STATES[state],
     }, 200
 
 
+# Read-check-update-insert for one guess. Runs inside a single primary
+# transaction on the connection's thread, so a guess costs one round trip.
+# With a cached copy of the game the read is skipped; if the copy turns out
+# to be stale (the conditional update matches nothing), the game is read from
+# the database and the guess applied once more.
+def commit_guess(connection, game_uuid, username, guess, valid_word_id, cached=None):
+    game = cached or load_game(connection, game_uuid, username)
+    result = apply_guess(connection, game_uuid, game, guess, valid_word_id)
+    if result is None and cached is not None:
+        game = load_game(connection, game_uuid, username)
+        result = apply_guess(connection, game_uuid, game, guess, valid_word_id)
+    if result is None:
+        abort(409, "Another guess was made on this game at the same time")
+    return result
+
+
+def load_game(connection, game_uuid, username):
+    game = connection.execute(
+        """
+        SELECT game_id, secret_word_id, guess_remaining, state
+        FROM games WHERE username=:username AND uuid=:uuid
+        """,
+        {"uuid": game_uuid, "username": username},
+    ).fetchone()
+
+    if not game:
+        if is_archived(connection, game_uuid, username):
+            abort(409, "This game is already over")
+        abort(400, "No game with this identifier for your username")
+    return CachedGame(
+        game_id=game["game_id"],
+        username=username,
+        secret_word_id=game["secret_word_id"],
+        guess_remaining=game["guess_remaining"],
+        state=game["state"],
+        guesses=tuple(map(tuple, guess_rows(connection, game["game_id"]))),
+        position=0,
+    )
+
+
+def is_archived(connection, game_uuid, username):
+    return (
+        connection.execute(
+            "SELECT 1 FROM archived_games WHERE username=:username AND uuid=:uuid",
+            {"uuid": game_uuid, "username": username},
+        ).fetchone()
+        is not None
+    )
+
+
+# Apply a guess to `game`, or return None if the game changed since it was
+# read. The returned "game" is the new state to cache, None once it is over.
+# A finished game is counted in the user's statistics and queued for the
+# leaderboard in the same transaction.
+def apply_guess(connection, game_uuid, game, guess, valid_word_id):
+    if game.state != 0:
+        abort(409, "This game is already over")
+
+    secret_word = word_list.secret_word(game.secret_word_id)
+    state = 0
+    # when the user guessed the correct word
+    if guess == secret_word:
+        state = 1
+
+    if valid_word_id is None and not state:
+        abort(400, "Bad Request: Not a valid guess")
+
+    # Decrement the guess remaining, user lost the game if none are left
+    guess_remaining = game.guess_remaining - 1
+    if guess_remaining == 0 and state == 0:
+        state = 2
+
+    # Only applies if no other guess changed the game since it was read. A
+    # finished game takes the position bump_position() is about to return, the
+    # order games finished in for streaks (see bin/rebuild_stats.py).
+    updated = connection.execute(
+        """
+        UPDATE games
+        SET guess_remaining=:guess_remaining, state=:state, finished_at=:finished_at,
+            finish_position=CASE WHEN :state != 0
+                THEN (SELECT position + 1 FROM replication_position) END
+        WHERE game_id=:game_id AND guess_remaining=:expected AND state=0
+        """,
+        {
+            "guess_remaining": guess_remaining,
+            "state": state,
+            "finished_at": int(time.time()) if state else None,
+            "game_id": game.game_id,
+            "expected": game.guess_remaining,
+        },
+    ).rowcount
+    if updated != 1:
+        return None
+    position = bump_position(connection)
+
+    if state:
+        record_finished_game(connection, game.username, state, 6 - guess_remaining)
+        queue_entry(connection, game_uuid, game.username, state == 1, 6 - guess_remaining)
+        return {
+            "state": state,
+            "guess_remaining": guess_remaining,
+            "position": position,
+            "game": None,
+        }
+
+    row = (6 - guess_remaining, valid_word_id, feedback.pattern(secret_word, guess))
+    connection.execute(
+        """
+        INSERT INTO guesses(game_id, guess_number, valid_word_id, feedback)
+        VALUES(:game_id, :guess_number, :valid_word_id, :feedback)
+        """,
+        {
+            "game_id": game.game_id,
+            "guess_number": row[0],
+            "valid_word_id": row[1],
+            "feedback": row[2],
+        },
+    )
+    game = dataclasses.replace(
+        game,
+        guess_remaining=guess_remaining,
+        guesses=game.guesses + (row,),
+        position=position,
+    )
+    return {
+        "state": state,
+        "guess_remaining": guess_remaining,
+        "position": position,
+        "game": game,
+        "guesses": format_guesses(game.guesses, secret_word),
+    }
+
+
+# Count a finished game in the user's statistics, in the same transaction
+def record_finished_game(connection, username, state, number_of_guesses):
+    won = int(state == 1)
+    values = {"username": username, "won": won, "lost": 1 - won}
+    for n in range(1, 7):
+        values[f"guesses_{n}"] = int(won and number_of_guesses == n)
+    connection.execute(
+        """
+        INSERT INTO user_stats(
+            username, wins, losses,
+            guesses_1, guesses_2, guesses_3, guesses_4, guesses_5, guesses_6,
+            current_streak, max_streak
+        )
+        VALUES(
+            :username, :won, :lost,
+            :guesses_1, :guesses_2, :guesses_3, :guesses_4, :guesses_5, :guesses_6,
+            :won, :won
+        )
+        ON CONFLICT(username) DO UPDATE SET
+            in_progress = max(in_progress - 1, 0),
+            wins = wins + :won,
+            losses = losses + :lost,
+            guesses_1 = guesses_1 + :guesses_1,
+            guesses_2 = guesses_2 + :guesses_2,
+            guesses_3 = guesses_3 + :guesses_3,
+            guesses_4 = guesses_4 + :guesses_4,
+            guesses_5 = guesses_5 + :guesses_5,
+            guesses_6 = guesses_6 + :guesses_6,
+            current_streak = CASE WHEN :won THEN current_streak + 1 ELSE 0 END,
+            max_streak = max(max_streak, CASE WHEN :won THEN current_streak + 1 ELSE 0 END)
+        """,
+        values,
+    )
+
+
 @tag(["Games"])
 @app.route("/games/<string:game_id>", methods=["GET"])
 async def check_game_progress(game_id):
     """Check the state of a game that is in progress. If game is over show whether user won/lost and no. of guesses"""
-    username = request.authorization.username
-
-    games_output = await get_game_info(game_id, username)
+    game = await current_game(parse_game_id(game_id), _get_username())
 
-    if games_output["state"] != 0:
+    if game.state != 0:
         return {
-            "number_of_guesses": 6 - games_output["guess_remaining"],
-            "game_state": STATES.get(games_output["state"]),
+            "number_of_guesses": 6 - game.guess_remaining,
+            "game_state": STATES.get(game.state),
         }, 200
 
-    secret_word = games_output["secret_word"]
-    state = 0
-    guess_remaining = games_output["guess_remaining"]
-    # Prepare the response
-
-    guesses = await get_guesses(game_id, secret_word)
     return {
-        "guesses": guesses,
-        "guess_remaining": guess_remaining,
-        "game_state": STATES[state],
+        "guesses": format_guesses(game.guesses, word_list.secret_word(game.secret_word_id)),
+        "guess_remaining": game.guess_remaining,
+        "game_state": STATES[0],
     }, 200
 
 
+@tag(["Games"])
+@app.route("/games/<string:game_id>/candidates", methods=["GET"])
+async def count_candidates(game_id):
+    """How many secret words are still possible given the feedback on the guesses made so far"""
+    game = await current_game(parse_game_id(game_id), _get_username())
+    if game.state != 0:
+        abort(409, "This game is already over")
+    candidates = _get_solver().candidates(game_feedback(game))
+    return {"candidates": len(candidates), "guess_remaining": game.guess_remaining}
+
+
+@tag(["Games"])
+@app.route("/games/<string:game_id>/hint", methods=["GET"])
+async def hint(game_id):
+    """The best next guess: the valid word whose feedback is expected to narrow down the remaining secret words the most"""
+    game = await current_game(parse_game_id(game_id), _get_username())
+    if game.state != 0:
+        abort(409, "This game is already over")
+    solver = _get_solver()
+    candidates = solver.candidates(game_feedback(game))
+    valid_word_id, bits = await asyncio.get_running_loop().run_in_executor(
+        None, solver.best_guess, candidates
+    )
+    return {
+        "guess": word_list.valid_word(valid_word_id),
+        "expected_information_bits": round(bits, 3),
+        "candidates": len(candidates),
+    }
+
+
+# The game as a CachedGame: from this worker's cache unless the client has
+# written since the cached copy was current, else from a replica (caching it
+# if still in progress). Finished games have no guesses loaded.
+async def current_game(game_uuid, username):
+    cached = game_cache.get(game_uuid, client_position(request))
+    if cached is not None and cached.username == username:
+        return cached
+
+    games_output = await get_game_info(game_uuid, username)
+    game = CachedGame(
+        game_id=games_output["game_id"],
+        username=username,
+        secret_word_id=games_output["secret_word_id"],
+        guess_remaining=games_output["guess_remaining"],
+        state=games_output["state"],
+        guesses=(),
+        position=0,
+    )
+    if game.state != 0:
+        return game
+
+    read_db = await _get_read_db()
+    rows = await read_db.run(guess_rows, game.game_id)
+    # The replica has applied at least this much
+    game = dataclasses.replace(
+        game, guesses=tuple(map(tuple, rows)), position=read_db.position
+    )
+    game_cache.put(game_uuid, game)
+    return game
+
+
+# (valid_word_id, feedback code) for each stored guess of a game
+def game_feedback(game):
+    secret_word = word_list.secret_word(game.secret_word_id)
+    return [
+        (
+            valid_word_id,
+            feedback.pattern(secret_word, word_list.valid_word(valid_word_id))
+            if pattern is None
+            else pattern,
+        )
+        for _, valid_word_id, pattern in game.guesses
+    ]
+
+
 @tag(["Statistics"])
 @app.route("/games", methods=["GET"])
 async def get_in_progress_games():
-    """Check the list of in-progress games for a particular user"""
+    """List a user's games, in-progress ones by default. Query parameters: state (in_progress, won, lost, finished or all), limit, and after (the cursor from the Link header of the previous page). With format=ndjson, every matching game is streamed as one JSON object per line"""
     db = await _get_read_db()
-    username = request.authorization.username
+    username = _get_username()
+
+    states = LIST_STATES.get(request.args.get("state", "in_progress"))
+    if states is None:
+        abort(400, "Bad Request: state should be one of " + ", ".join(LIST_STATES))
+    after = decode_cursor(request.args.get("after"))
+    config = app.config["GAMES_LIST"]
+
+    if request.args.get("format") == "ndjson":
+        # A long read on the primary would hold off every write's COMMIT
+        if db.url == app.config["DATABASES"]["GAME_URL"]:
+            abort(
+                503,
+                "No replica can stream your games yet, retry shortly or list them a page at a time",
+            )
+        if db.streams_full():
+            abort(503, "Streaming is busy, retry shortly or list games a page at a time")
+        rows = stream_games(db, username, states, after, config["STREAM_BATCH"])
+        return ndjson(rows), 200, {"Content-Type": "application/x-ndjson"}
+
+    try:
+        limit = int(request.args.get("limit", config["PAGE_SIZE"]))
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= config["MAX_PAGE_SIZE"]:
+        abort(400, f"Bad Request: limit should be 1 to {config['MAX_PAGE_SIZE']}")
+
+    # One extra row tells whether there is a next page
+    rows = await db.run(list_games, username, states, after, limit + 1)
+    headers = {}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        query = dict(request.args, after=encode_cursor(last["state"], last["game_id"]))
+        headers["Link"] = '<{}?{}>; rel="next"'.format(
+            request.path, urllib.parse.urlencode(query)
+        )
+    return [game_summary(row) for row in rows], 200, headers
+
+
+# Filters for GET /games, as the states they cover in listing order
+LIST_STATES = {
+    "in_progress": (0,),
+    "won": (1,),
+    "lost": (2,),
+    "finished": (1, 2),
+    "all": (0, 1, 2),
+}
+
+# Finished games may have been moved to archived_games
+LIST_QUERY = """
+    SELECT game_id, state, guess_remaining, uuid
+    FROM games
+    WHERE username=:username AND state=:state AND game_id > :after
+    UNION ALL
+    SELECT game_id, state, guess_remaining, uuid
+    FROM archived_games
+    WHERE username=:username AND state=:state AND game_id > :after
+    ORDER BY game_id
+    LIMIT :limit
+"""
+
+
+# Games are listed by state, then by game_id within a state, so each step is
+# a seek on games_idx_usernamestate (username, state, game_id) and its
+# archived_games twin. The cursor is the (state, game_id) of the last game
+# returned.
+def list_games(connection, username, states, after, limit):
+    rows = []
+    for state in states:
+        if state < after[0]:
+            continue
+        rows += connection.execute(
+            LIST_QUERY,
+            {
+                "username": username,
+                "state": state,
+                "after": after[1] if state == after[0] else 0,
+                "limit": limit - len(rows),
+            },
+        ).fetchall()
+        if len(rows) == limit:
+            break
+    return rows
 
-    # showing only in-progress games
-    games_output = await db.fetch_all(
-        """
-        SELECT guess_remaining, game_id
-        FROM games 
-        WHERE username =:username AND state = :state 
-        """,
-        values={"username": username, "state": 0},
-    )
 
-    in_progress_games = []
-    for guess_remaining, game_id in games_output:
-        in_progress_games.append(
-            {"guess_remaining": guess_remaining, "game_id": game_id}
+async def stream_games(db, username, states, after, batch):
+    queries = [
+        (
+            LIST_QUERY,
+            {
+                "username": username,
+                "state": state,
+                "after": after[1] if state == after[0] else 0,
+                "limit": -1,
+            },
         )
+        for state in states
+        if state >= after[0]
+    ]
+    async for row in db.iterate(queries, batch):
+        yield row
 
-    return in_progress_games
+
+async def ndjson(rows):
+    async for row in rows:
+        yield (json.dumps(game_summary(row)) + "\n").encode("utf-8")
+
+
+def game_summary(row):
+    return {
+        "guess_remaining": row["guess_remaining"],
+        "game_id": str(uuid.UUID(bytes=row["uuid"])),
+        "game_state": STATES[row["state"]],
+    }
+
+
+def encode_cursor(state, game_id):
+    return base64.urlsafe_b64encode(f"{state}.{game_id}".encode("ascii")).decode("ascii")
+
+
+# (state, game_id) from an `after` cursor; no cursor starts from the beginning
+def decode_cursor(cursor):
+    if not cursor:
+        return (0, 0)
+    try:
+        state, game_id = base64.urlsafe_b64decode(cursor.encode("ascii")).split(b".")
+        return (int(state), int(game_id))
+    except ValueError:
+        abort(400, "Bad Request: Invalid cursor")
 
 
 @tag(["Statistics"])
 @app.route("/games/statistics", methods=["GET"])
 async def statistics():
-    """Checking the statistics for a particular user"""
+    """Checking the statistics for a particular user: games in progress, won and lost, how many guesses won games took, and the current and longest winning streaks"""
     db = await _get_read_db()
-    username = request.authorization.username
+    username = _get_username()
 
-    res_games = await db.fetch_all(
-        """
-        SELECT state, count(*)
-        FROM games 
-        WHERE username=:username 
-        GROUP BY state
-        """,
+    stats = await db.fetch_one(
+        "SELECT * FROM user_stats WHERE username=:username",
         values={"username": username},
     )
-    games_stats = {}
-    for state, count in res_games:
-        games_stats[STATES[state]] = count
+    if stats is None:
+        stats = collections.defaultdict(int)
+
+    return {
+        STATES[0]: stats["in_progress"],
+        STATES[1]: stats["wins"],
+        STATES[2]: stats["losses"],
+        "guess_distribution": {
+            str(n): stats[f"guesses_{n}"] for n in range(1, 7)
+        },
+        "current_streak": stats["current_streak"],
+        "max_streak": stats["max_streak"],
+    }
+
 
-    return games_stats
+@tag(["Replication"])
+@app.route("/metrics/replication", methods=["GET"])
+async def replication_metrics():
+    """How reads are routed (to a replica, after waiting for one to catch up, to the primary, or without a position) and each replica's health"""
+    return replica_set.stats()
 
 
-async def get_game_info(game_id, username):
+# A game from games or, once archived, archived_games, in one statement so
+# a game being archived on the replica is found in one or the other
+async def get_game_info(game_uuid, username):
     read_db = await _get_read_db()
     games_output = await read_db.fetch_one(
         """
-        SELECT correct_words.correct_word secret_word, guess_remaining, state 
-        FROM games JOIN correct_words WHERE username=:username 
-        AND game_id=:game_id AND correct_words.correct_word_id=games.secret_word_id
+        SELECT game_id, secret_word_id, guess_remaining, state 
+        FROM games WHERE username=:username AND uuid=:uuid
+        UNION ALL
+        SELECT game_id, secret_word_id, guess_remaining, state
+        FROM archived_games WHERE username=:username AND uuid=:uuid
         """,
-        values={"game_id": game_id, "username": username},
+        values={"uuid": game_uuid, "username": username},
     )
 
     if not games_output:
         abort(400, "No game with this identifier for your username")
 
-    return games_output
-
-
-# Function to compare the guess to answer.
-def compare(secret_word, guess):
-    secret_word_lst = [i for i in enumerate(secret_word)]
-    guess_list = [i for i in enumerate(guess)]
-
-    temp_correct_positions = []
-    correct_positions = []
-    incorrect_positions = []
-    for i in range(0, len(secret_word)):
-        if guess_list[i][1] == secret_word_lst[i][1]:
-            temp_correct_positions.append(guess_list[i])
-            correct_positions.append(((guess_list[i][0] + 1), guess_list[i][1]))
-
-    secret_word_lst = [i for i in secret_word_lst if i not in temp_correct_positions]
-    guess_list = [i for i in guess_list if i not in temp_correct_positions]
-
-    for i in range(len(guess_list)):
-        for j in range(len(secret_word_lst)):
-            # found a character which is in a different position
-            if guess_list[i][1] == secret_word_lst[j][1]:
-                incorrect_positions.append((guess_list[i][0] + 1, guess_list[i][1]))
-                secret_word_lst.pop(j)
-                break
-
-    return correct_positions, incorrect_positions
+    return {
+        "game_id": games_output["game_id"],
+        "secret_word_id": games_output["secret_word_id"],
+        "secret_word": word_list.secret_word(games_output["secret_word_id"]),
+        "guess_remaining": games_output["guess_remaining"],
+        "state": games_output["state"],
+    }
+
+
+# The stored 16-byte form of a public game id. Anything that is not a UUID
+# cannot name a game.
+def parse_game_id(game_id):
+    try:
+        return uuid.UUID(game_id).bytes
+    except ValueError:
+        abort(400, "No game with this identifier for your username")
 
 
-async def get_guesses(game_id, secret_word):
-    db = await _get_read_db()
-    guess_output = await db.fetch_all(
+def guess_rows(connection, game_id):
+    return connection.execute(
         """
-        SELECT guess_number, valid_words.valid_word 
+        SELECT guess_number, valid_word_id, feedback
         FROM guesses 
-        JOIN valid_words 
-        WHERE game_id=:game_id AND valid_words.valid_word_id=guesses.valid_word_id
+        WHERE game_id=:game_id
         ORDER BY guess_number
         """,
-        values={"game_id": game_id},
-    )
+        {"game_id": game_id},
+    ).fetchall()
+
+
+def format_guesses(rows, secret_word):
     guesses = []
-    for guess_number, valid_word in guess_output:
-        correct_positions, incorrect_positions = compare(secret_word, valid_word)
-        guesses.append(
-            {
-                "guess": valid_word,
-                "guess_number": guess_number,
-                "correct_positions": dict(correct_positions),
-                "incorrect_positions:": dict(incorrect_positions),
-            }
-        )
+    for guess_number, valid_word_id, pattern in rows:
+        valid_word = word_list.valid_word(valid_word_id)
+        # Rows written before bin/migrate_feedback.py was run
+        if pattern is None:
+            pattern = feedback.pattern(secret_word, valid_word)
+        guesses.append(format_guess(valid_word, guess_number, pattern))
     return guesses
 
 
+def format_guess(guess, guess_number, pattern):
+    correct_positions, incorrect_positions = feedback.decode(pattern, guess)
+    return {
+        "guess": guess,
+        "guess_number": guess_number,
+        "correct_positions": dict(correct_positions),
+        "incorrect_positions:": dict(incorrect_positions),
+    }
+
+
 # Error status: Client error.
 @app.errorhandler(RequestSchemaValidationError)
 def bad_request(e):
@@ -388,6 +916,12 @@ def conflict(e):
     return {"error": str(e)}, 409
 
 
+# Error status: Service unavailable.
+@app.errorhandler(503)
+def unavailable(e):
+    return jsonify({"message": e.description}), 503
+
+
 # Error status: Unauthorized client.
 @app.errorhandler(401)
 def unauthorized(e):
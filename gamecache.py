@@ -0,0 +1,73 @@
+# Imports
+import collections
+import dataclasses
+import time
+
+
+# Everything a guess or a progress check needs about an in-progress game.
+# `guesses` holds the stored (guess_number, valid_word_id, feedback) rows and
+# `position` is the replication position the entry is known to be current at.
+@dataclasses.dataclass(frozen=True)
+class CachedGame:
+    game_id: int
+    username: str
+    secret_word_id: int
+    guess_remaining: int
+    state: int
+    guesses: tuple
+    position: int
+
+
+# Bounded LRU cache of in-progress games, keyed by the public UUID bytes, with
+# entries expiring `ttl` seconds after they were last written. Only touched
+# from the event loop: transactions get a CachedGame snapshot and the caller
+# writes the result back after the commit.
+class GameCache:
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self._entries = collections.OrderedDict()
+        # hit, miss, expired, behind (older than the client's last write)
+        # and eviction counts
+        self.counts = collections.Counter()
+
+    # The cached game, unless it may be older than the client's last write
+    def get(self, key, position=None):
+        item = self._entries.get(key)
+        if item is None:
+            self.counts["miss"] += 1
+            return None
+        expires, game = item
+        if expires < time.monotonic():
+            del self._entries[key]
+            self.counts["expired"] += 1
+            return None
+        if position is not None and position > game.position:
+            self.counts["behind"] += 1
+            return None
+        self._entries.move_to_end(key)
+        self.counts["hit"] += 1
+        return game
+
+    # Store `game`, unless a newer copy is already cached (a slow read racing
+    # a write-through)
+    def put(self, key, game):
+        if self.size <= 0:
+            return
+        current = self._entries.get(key)
+        if current is not None and current[1].position > game.position:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, game)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+            self.counts["eviction"] += 1
+
+    def discard(self, key):
+        self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return {"size": len(self), "capacity": self.size, **self.counts}
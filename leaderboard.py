@@ -1,7 +1,16 @@
+import asyncio
+import collections
 import dataclasses
+import datetime
+import json
+import time
+import urllib.parse
+from typing import List
 import toml
-import redis
-from quart import Quart, g, request, abort, jsonify
+import redis.asyncio as redis
+from redis.utils import HIREDIS_AVAILABLE
+from metrics import Metrics, instrument
+from quart import Quart, Response, g, request, abort, jsonify
 from quart_schema import QuartSchema, RequestSchemaValidationError, validate_request, tag
 
 
@@ -10,6 +19,69 @@ app = Quart(__name__)
 QuartSchema(app, tags=[{"name": "Leaderboard", "description": "Leaderboard for Wordle Scores"}])
 app.config.from_file(f"./etc/wordle.toml", toml.load)
 
+# Opt-in Prometheus metrics, served on /metrics when [METRICS] ENABLED
+metrics = Metrics(app.config["METRICS"]["ENABLED"])
+instrument(app, metrics)
+redis_seconds = metrics.histogram(
+    "wordle_redis_seconds", "Time for a Redis call, by command"
+)
+
+# One pooled asyncio client per process, created at startup
+redis_client = None
+add_entry_script = None
+rollup_task = None
+# A TopCache per window
+top_caches = {}
+metrics.callback(
+    "wordle_leaderboard_cache_total",
+    "counter",
+    "Top-N cache reads by window and result: fresh, revalidated (version unchanged) or reloaded",
+    lambda: [
+        ({"window": window, "result": result}, count)
+        for window, cache in top_caches.items()
+        for result, count in cache.counts.items()
+    ],
+)
+
+# Bumped by every update, so cached reads can tell whether they are current
+VERSION_KEY = "leaderboard:version"
+
+# Leaderboards by window: all-time, today (UTC) and the last 7 days
+WINDOWS = ("all", "daily", "weekly")
+WEEK_DAYS = 7
+# Days with games whose ids are still kept for de-duplication, by day
+DAYS_KEY = "games:days"
+# Held by the worker running the scheduled rollup
+ROLLUP_LOCK = "leaderboard:rollup:lock"
+
+
+# Today's UTC date as YYYYMMDD, which names the day's keys
+def today():
+    return int(datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%d"))
+
+
+def days_before(day, days):
+    date = datetime.datetime.strptime(str(day), "%Y%m%d") - datetime.timedelta(days=days)
+    return int(date.strftime("%Y%m%d"))
+
+
+# The sorted set holding a window's leaderboard
+def window_key(window, day=None):
+    if window == "daily":
+        return f"leaderboard:daily:{day or today()}"
+    if window == "weekly":
+        return "leaderboard:weekly"
+    return "leaderboard"
+
+
+# The ?window= of a read, "all" by default
+def request_window():
+    window = request.args.get("window", "all")
+    if window not in WINDOWS:
+        abort(400, f"Bad Request: window should be one of {', '.join(WINDOWS)}")
+    return window
+
+
 @dataclasses.dataclass
 class Entry:
     game_id: str
@@ -18,13 +90,349 @@ class Entry:
     number_of_guesses: int
 
 
+@dataclasses.dataclass
+class Batch:
+    entries: List[Entry]
+
+
+# The top `size` ranks of a window's leaderboard as (member, score) pairs,
+# with the version they were read at. The version is asked for again at most
+# every `check` seconds; the ranks are only read again when it has changed
+# (or the window has moved on to a new day). One request refreshes at a time
+# while the others wait for its result.
+class TopCache:
+    def __init__(self, window, size, check):
+        self.window = window
+        self.size = size
+        self.check = check
+        self.key = None
+        self.version = None
+        self.entries = []
+        self.checked = 0.0
+        self._lock = asyncio.Lock()
+        # fresh, revalidated and reloaded reads
+        self.counts = collections.Counter()
+
+    def _fresh(self):
+        return self.version is not None and time.monotonic() - self.checked < self.check
+
+    async def get(self):
+        if self._fresh():
+            self.counts["fresh"] += 1
+            return self.version, self.entries
+        async with self._lock:
+            if self._fresh():
+                self.counts["fresh"] += 1
+                return self.version, self.entries
+            key = window_key(self.window)
+            with redis_seconds.time(command="get_version"):
+                version = int(await redis_client.get(VERSION_KEY) or 0)
+            if version == self.version and key == self.key:
+                self.counts["revalidated"] += 1
+            else:
+                # The version and the ranks it stands for, read atomically
+                async with redis_client.pipeline(transaction=True) as pipe:
+                    pipe.get(VERSION_KEY)
+                    pipe.zrevrange(key, 0, self.size - 1, withscores=True)
+                    with redis_seconds.time(command="zrevrange"):
+                        version, entries = await pipe.execute()
+                self.key = key
+                self.version = int(version or 0)
+                self.entries = [(member.decode(), score) for member, score in entries]
+                self.counts["reloaded"] += 1
+            self.checked = time.monotonic()
+            return self.version, self.entries
+
+
+# Redis client backed by a blocking connection pool, so bursts of requests
+# wait for a free connection instead of failing
+def _create_redis():
+    config = app.config["REDIS"]
+    pool = redis.BlockingConnectionPool(
+        host=config["HOST"],
+        port=config["PORT"],
+        db=config["DB"],
+        max_connections=config["MAX_CONNECTIONS"],
+        timeout=config["POOL_TIMEOUT"],
+    )
+    return redis.Redis(connection_pool=pool)
+
+
+# Open the Redis connection pool once for the lifetime of the process
+@app.before_serving
+async def connect_redis():
+    global redis_client, add_entry_script, rollup_task
+    if not HIREDIS_AVAILABLE:
+        app.logger.warning("hiredis is not installed, using the Python parser")
+    redis_client = _create_redis()
+    add_entry_script = redis_client.register_script(ADD_ENTRY_SCRIPT)
+    config = app.config["LEADERBOARD"]
+    for window in WINDOWS:
+        top_caches[window] = TopCache(window, config["CACHE_TOP"], config["CHECK_MS"] / 1000)
+    if config["ROLLUP_MS"] > 0:
+        rollup_task = asyncio.ensure_future(rollup_forever(config["ROLLUP_MS"] / 1000))
+
+
+# Close the Redis connection pool on shutdown
+@app.after_serving
+async def disconnect_redis():
+    global rollup_task
+    if rollup_task is not None:
+        rollup_task.cancel()
+        try:
+            await rollup_task
+        except asyncio.CancelledError:
+            pass
+        rollup_task = None
+    top_caches.clear()
+    await redis_client.aclose()
+
+
 @tag(["Leaderboard"])
 @app.route("/leaderboard/top10", methods=["GET"])
 async def leaderboard():
-    """ Returns the top 10 users based on the average of their scores """
-    r = redis.Redis()
-    res = r.zrevrange("leaderboard", 0, 9, True)
-    return jsonify(res), 200
+    """ Returns the top 10 users based on the average of their scores, as [member, score] pairs: all-time, or with window=daily (today, UTC) or window=weekly (the last 7 days). Served from a cache that is current to within [LEADERBOARD] CHECK_MS, with an ETag for conditional requests """
+    version, entries = await top_caches[request_window()].get()
+    return conditional(entries[:10], version)
+
+
+@tag(["Leaderboard"])
+@app.route("/leaderboard", methods=["GET"])
+async def leaderboard_page():
+    """ Returns a page of the leaderboard: query parameters offset (0 for the top), limit and window (all, daily or weekly). The Link header holds the URL of the next page """
+    config = app.config["LEADERBOARD"]
+    window = request_window()
+    top_cache = top_caches[window]
+    try:
+        offset = int(request.args.get("offset", 0))
+        limit = int(request.args.get("limit", config["PAGE_SIZE"]))
+    except ValueError:
+        abort(400, "Bad Request: offset and limit should be integers")
+    if offset < 0 or not 1 <= limit <= config["MAX_PAGE_SIZE"]:
+        abort(400, f"Bad Request: limit should be 1 to {config['MAX_PAGE_SIZE']}")
+
+    if offset + limit <= top_cache.size:
+        version, entries = await top_cache.get()
+        entries = entries[offset : offset + limit]
+    else:
+        # Below the cached ranks
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.get(VERSION_KEY)
+            pipe.zrevrange(window_key(window), offset, offset + limit - 1, withscores=True)
+            with redis_seconds.time(command="zrevrange"):
+                version, entries = await pipe.execute()
+        version = int(version or 0)
+        entries = [(member.decode(), score) for member, score in entries]
+
+    headers = {}
+    if len(entries) == limit:
+        query = urllib.parse.urlencode(
+            {"offset": offset + limit, "limit": limit, "window": window}
+        )
+        headers["Link"] = f'<{request.path}?{query}>; rel="next"'
+    body = {
+        "entries": [
+            ranked(member, score, offset + i) for i, (member, score) in enumerate(entries)
+        ]
+    }
+    return conditional(body, version, headers)
+
+
+@tag(["Leaderboard"])
+@app.route("/leaderboard/users/<string:username>", methods=["GET"])
+async def user_rank(username):
+    """ Returns a user's rank (1 is the top) and average score, all-time or in the window given by window (daily or weekly) """
+    key = window_key(request_window())
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.get(VERSION_KEY)
+        pipe.zrevrank(key, "user:" + username)
+        pipe.zscore(key, "user:" + username)
+        with redis_seconds.time(command="zrevrank"):
+            version, rank, score = await pipe.execute()
+    if rank is None:
+        abort(404, "This user has no scores on the leaderboard")
+    body = ranked("user:" + username, score, rank)
+    return conditional(body, int(version or 0))
+
+
+# One leaderboard entry. `index` counts from 0 at the top.
+def ranked(member, score, index):
+    return {"rank": index + 1, "username": member.split(":", 1)[1], "score": score}
+
+
+# A JSON response tagged with the leaderboard version it was read at, or 304
+# Not Modified if the client already has that version. Any update to the
+# leaderboard changes every ETag.
+def conditional(body, version, headers=None):
+    etag = f"v{version}"
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        response = Response(json.dumps(body), content_type="application/json")
+    response.set_etag(etag)
+    response.headers.update(headers or {})
+    return response
+
+
+# Records one game's score and recomputes the user's mean in a single atomic
+# round trip. The user's running sum and count live in score:<username>, so
+# an update no longer reads every game. Re-reporting a game_id replaces its
+# all-time score instead of counting it twice, as long as the game is still
+# in user:<username> (see compact()). Totals for users reported before they
+# existed are built once, from their game hash. Every update bumps the
+# leaderboard version.
+#
+# A game reported for the first time also counts towards today's window:
+# daily:<day>:sum and :count, and leaderboard:daily:<day> with the mean, all
+# expiring after [LEADERBOARD] DAILY_TTL_DAYS. The game is indexed under
+# games:<day> (as <length of username>:<username><game>), and the day in
+# games:days, so it can be dropped from user:<username> once it is too old
+# to be re-reported.
+ADD_ENTRY_SCRIPT = """
+local games, totals, leaderboard, version = KEYS[1], KEYS[2], KEYS[3], KEYS[4]
+local day_sum, day_count, day_board = KEYS[5], KEYS[6], KEYS[7]
+local day_games, days = KEYS[8], KEYS[9]
+local game, score, member = ARGV[1], tonumber(ARGV[2]), ARGV[3]
+local username, day, ttl = ARGV[4], tonumber(ARGV[5]), tonumber(ARGV[6])
+
+if redis.call("EXISTS", totals) == 0 then
+    local sum = 0
+    local values = redis.call("HVALS", games)
+    for _, value in ipairs(values) do
+        sum = sum + tonumber(value)
+    end
+    redis.call("HSET", totals, "sum", sum, "count", #values)
+end
+
+local previous = redis.call("HGET", games, game)
+redis.call("HSET", games, game, score)
+if previous then
+    redis.call("HINCRBY", totals, "sum", score - tonumber(previous))
+else
+    redis.call("HINCRBY", totals, "sum", score)
+    redis.call("HINCRBY", totals, "count", 1)
+
+    local day_total = tonumber(redis.call("ZINCRBY", day_sum, score, member))
+    local day_games_played = tonumber(redis.call("ZINCRBY", day_count, 1, member))
+    redis.call("ZADD", day_board, day_total / day_games_played, member)
+    for _, key in ipairs({day_sum, day_count, day_board}) do
+        redis.call("EXPIRE", key, ttl)
+    end
+    redis.call("SADD", day_games, #username .. ":" .. username .. game)
+    redis.call("ZADD", days, day, day)
+end
+
+local sum = tonumber(redis.call("HGET", totals, "sum"))
+local count = tonumber(redis.call("HGET", totals, "count"))
+redis.call("ZADD", leaderboard, sum / count, member)
+redis.call("INCR", version)
+return tostring(sum / count)
+"""
+
+
+# Keys and arguments of ADD_ENTRY_SCRIPT for one game
+def entry_call(game_id, username, score, day):
+    member = "user:" + username
+    ttl = app.config["LEADERBOARD"]["DAILY_TTL_DAYS"] * 86400
+    return {
+        "keys": [
+            member,
+            "score:" + username,
+            "leaderboard",
+            VERSION_KEY,
+            f"daily:{day}:sum",
+            f"daily:{day}:count",
+            window_key("daily", day),
+            f"games:{day}",
+            DAYS_KEY,
+        ],
+        "args": ["game:" + game_id, score, member, username, day, ttl],
+    }
+
+
+# Build the weekly leaderboard from the last WEEK_DAYS days, ending on `day`,
+# from the daily sums and counts. ZUNIONSTORE adds up the days in Redis; the
+# means are then written to a scratch key `batch` users at a time, so Redis
+# is never blocked for long, and the scratch key replaces the weekly
+# leaderboard in one step. Returns how many users are on it.
+async def rollup(day, batch=1000):
+    days = [days_before(day, i) for i in range(WEEK_DAYS)]
+    week_sum, week_count = "leaderboard:weekly:sum", "leaderboard:weekly:count"
+    scratch = "leaderboard:weekly:scratch"
+    with redis_seconds.time(command="rollup"):
+        await redis_client.zunionstore(week_sum, [f"daily:{d}:sum" for d in days])
+        await redis_client.zunionstore(week_count, [f"daily:{d}:count" for d in days])
+        await redis_client.delete(scratch)
+        cursor = 0
+        while True:
+            cursor, rows = await redis_client.zscan(week_sum, cursor, count=batch)
+            if rows:
+                counts = await redis_client.zmscore(week_count, [member for member, _ in rows])
+                await redis_client.zadd(
+                    scratch,
+                    {member: total / count for (member, total), count in zip(rows, counts)},
+                )
+            if cursor == 0:
+                break
+        users = await redis_client.zcard(scratch)
+        async with redis_client.pipeline(transaction=True) as pipe:
+            if users:
+                pipe.rename(scratch, window_key("weekly"))
+            else:
+                pipe.delete(window_key("weekly"))
+            pipe.delete(week_sum, week_count)
+            pipe.incr(VERSION_KEY)
+            await pipe.execute()
+    return users
+
+
+# Drop games indexed on days before `before` from their users' game hashes.
+# Their scores stay in the users' totals; only the per-game entries, kept to
+# recognise a re-reported game, go. Works through a day in batches, so
+# Redis is never blocked for long.
+async def compact(before, batch=1000):
+    removed = 0
+    for day in await redis_client.zrangebyscore(DAYS_KEY, "-inf", f"({before}"):
+        key = f"games:{int(day)}"
+        members = []
+        async for member in redis_client.sscan_iter(key, count=batch):
+            members.append(member)
+            if len(members) >= batch:
+                removed += await _forget_games(members)
+                members = []
+        removed += await _forget_games(members)
+        await redis_client.delete(key)
+        await redis_client.zrem(DAYS_KEY, day)
+    return removed
+
+
+async def _forget_games(members):
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for member in members:
+            length, rest = member.split(b":", 1)
+            username, game = rest[: int(length)], rest[int(length) :]
+            pipe.hdel(b"user:" + username, game)
+        with redis_seconds.time(command="compact"):
+            await pipe.execute()
+    return len(members)
+
+
+# Every `interval` seconds, one worker (whichever takes the lock) rebuilds
+# the weekly leaderboard and compacts game hashes older than RETAIN_DAYS
+async def rollup_forever(interval):
+    while True:
+        try:
+            if await redis_client.set(ROLLUP_LOCK, 1, nx=True, px=int(interval * 900)):
+                day = today()
+                await rollup(day)
+                retain = app.config["LEADERBOARD"]["RETAIN_DAYS"]
+                await compact(days_before(day, retain))
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Whatever failed, try again next interval rather than stop for good
+            app.logger.exception("Leaderboard rollup failed")
+        await asyncio.sleep(interval)
 
 
 @tag(["Leaderboard"])
@@ -32,31 +440,37 @@ async def leaderboard():
 @validate_request(Entry)
 async def add_entry(data):
     """
-    Reports game results by entry, recalculates the user's average, then 
-    updates the leaderboard average score.
-    We are storing entries as user: { game1: score1, game2: score2, ... }."""
-    r = redis.Redis()
-
-    # add the game result
+    Reports game results by entry, updates the user's running total, then 
+    updates the leaderboard average score, and today's.
+    We are storing recent entries as user: { game1: score1, game2: score2, ... }
+    and totals as score: { sum: ..., count: ... }."""
     entry = dataclasses.asdict(data)
     score = calculate_score(entry["is_win"], entry["number_of_guesses"])
-    r.hset("user:" + entry["username"], "game:" + entry["game_id"], score)
-
-    # get all the games of the user so we can calculate the average
-    games = r.hgetall("user:" + entry["username"])
+    with redis_seconds.time(command="add_entry"):
+        await add_entry_script(
+            **entry_call(entry["game_id"], entry["username"], score, today())
+        )
+    return "OK", 200
 
-    mean = 0
-    for val in games.values():
-        mean += int(val)
-    
-    mean = mean / len(games)
 
-    # update the leaderboard with the mean
-    leaderboard_entry = {
-        "user:" + entry["username"] : mean
-    }
-    r.zadd("leaderboard", leaderboard_entry)
-    return "OK", 200
+@tag(["Leaderboard"])
+@app.route("/leaderboard/add/batch", methods=["POST"])
+@validate_request(Batch)
+async def add_entries(data):
+    """
+    Reports many game results at once (used by the game service's outbox),
+    each applied as by /leaderboard/add, in one pipelined round trip. Safe to
+    resend: a game_id that was already reported keeps a single score."""
+    day = today()
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for entry in data.entries:
+            score = calculate_score(entry.is_win, entry.number_of_guesses)
+            await add_entry_script(
+                **entry_call(entry.game_id, entry.username, score, day), client=pipe
+            )
+        with redis_seconds.time(command="add_entries"):
+            await pipe.execute()
+    return {"added": len(data.entries)}, 200
 
 
 def calculate_score(is_win, number_of_guesses):
@@ -80,6 +494,12 @@ def conflict(e):
     return {"error": str(e)}, 409
 
 
+# Error status: Not found.
+@app.errorhandler(404)
+def not_found(e):
+    return jsonify({"message": e.description}), 404
+
+
 # Error status: Unauthorized client.
 @app.errorhandler(401)
 def unauthorized(e):
@@ -0,0 +1,169 @@
+# Imports
+import contextlib
+import time
+from quart import g, request
+
+# Upper bounds of the latency histogram buckets, in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for name, value in pairs
+    ) + "}"
+
+
+def _format_value(value):
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+# Monotonic count per label set
+class Counter:
+    kind = "counter"
+
+    def __init__(self, registry, name, help):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self._values = {}
+
+    def inc(self, value=1, **labels):
+        if not self.registry.enabled:
+            return
+        key = _label_key(labels)
+        self._values[key] = self._values.get(key, 0) + value
+
+    def samples(self):
+        for key, value in self._values.items():
+            yield self.name + _format_labels(key), value
+
+
+# Cumulative bucket counts, sum and count per label set
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, registry, name, help, buckets=BUCKETS):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self._values = {}
+
+    def observe(self, value, **labels):
+        if not self.registry.enabled:
+            return
+        key = _label_key(labels)
+        counts = self._values.get(key)
+        if counts is None:
+            # One count per bucket, then the sum and the total count
+            counts = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+        counts[-2] += value
+        counts[-1] += 1
+
+    # Time the body of a `with` block, awaits inside it included
+    @contextlib.contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        for key, counts in self._values.items():
+            for bound, count in zip(self.buckets, counts):
+                yield self.name + "_bucket" + _format_labels(key, [("le", bound)]), count
+            yield self.name + "_bucket" + _format_labels(key, [("le", "+Inf")]), counts[-1]
+            yield self.name + "_sum" + _format_labels(key), counts[-2]
+            yield self.name + "_count" + _format_labels(key), counts[-1]
+
+
+# Values read at scrape time, e.g. counters another object already keeps.
+# `fn` returns a list of (labels, value) pairs.
+class Callback:
+    def __init__(self, name, kind, help, fn):
+        self.name = name
+        self.kind = kind
+        self.help = help
+        self.fn = fn
+
+    def samples(self):
+        for labels, value in self.fn():
+            yield self.name + _format_labels(_label_key(labels)), value
+
+
+# In-process metrics for one service, rendered in the Prometheus text format.
+# When disabled, instruments can still be created and called but record
+# nothing, so the hot path pays one attribute check.
+class Metrics:
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._metrics = {}
+
+    def _register(self, metric):
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help):
+        return self._register(Counter(self, name, help))
+
+    def histogram(self, name, help, buckets=BUCKETS):
+        return self._register(Histogram(self, name, help, buckets))
+
+    def callback(self, name, kind, help, fn):
+        return self._register(Callback(name, kind, help, fn))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.append("# HELP {} {}".format(metric.name, metric.help))
+            lines.append("# TYPE {} {}".format(metric.name, metric.kind))
+            for sample, value in metric.samples():
+                lines.append("{} {}".format(sample, _format_value(value)))
+        return "\n".join(lines) + "\n"
+
+
+# Record every request's latency by route and status, and serve GET /metrics.
+# Does nothing unless metrics are enabled.
+def instrument(app, metrics):
+    if not metrics.enabled:
+        return
+    requests = metrics.histogram(
+        "wordle_http_request_seconds", "Time to handle a request, by route and status"
+    )
+
+    @app.before_request
+    async def start_request_timer():
+        g._request_start = time.perf_counter()
+
+    @app.after_request
+    async def record_request_time(response):
+        start = getattr(g, "_request_start", None)
+        if start is not None:
+            rule = request.url_rule.rule if request.url_rule else "unmatched"
+            requests.observe(
+                time.perf_counter() - start,
+                method=request.method,
+                endpoint=rule,
+                status=response.status_code,
+            )
+        return response
+
+    @app.route("/metrics", methods=["GET"])
+    async def prometheus_metrics():
+        """Metrics in the Prometheus text format"""
+        return metrics.render(), 200, {"Content-Type": CONTENT_TYPE}
@@ -0,0 +1,173 @@
+# Imports
+import asyncio
+import collections
+import json
+import sqlite3
+import time
+import urllib.request
+import uuid
+
+
+# Queue a finished game for the leaderboard, inside the transaction that
+# finishes it, so the report is never lost or sent for a rolled back game
+def queue_entry(connection, game_uuid, username, is_win, number_of_guesses):
+    connection.execute(
+        """
+        INSERT INTO leaderboard_outbox(uuid, username, is_win, number_of_guesses)
+        VALUES(:uuid, :username, :is_win, :number_of_guesses)
+        """,
+        {
+            "uuid": game_uuid,
+            "username": username,
+            "is_win": int(is_win),
+            "number_of_guesses": number_of_guesses,
+        },
+    )
+
+
+# Claim up to `batch` unclaimed (or expired) entries for `lease` seconds.
+# Entries already claimed `max_attempts` times were never acknowledged, so
+# they move to leaderboard_outbox_dead instead. Returns the claimed entries
+# and the dead ones.
+def claim_entries(connection, batch, lease, max_attempts=10):
+    now = time.time()
+    rows = connection.execute(
+        """
+        SELECT event_id, uuid, username, is_win, number_of_guesses, attempts
+        FROM leaderboard_outbox
+        WHERE claimed_until <= :now
+        ORDER BY event_id
+        LIMIT :batch
+        """,
+        {"now": now, "batch": batch},
+    ).fetchall()
+    dead = [row for row in rows if row["attempts"] >= max_attempts]
+    rows = [row for row in rows if row["attempts"] < max_attempts]
+    connection.executemany(
+        """
+        UPDATE leaderboard_outbox SET claimed_until=:until, attempts=attempts + 1
+        WHERE event_id=:event_id
+        """,
+        [{"until": now + lease, "event_id": row["event_id"]} for row in rows],
+    )
+    if dead:
+        connection.executemany(
+            """
+            INSERT INTO leaderboard_outbox_dead(
+                event_id, uuid, username, is_win, number_of_guesses, attempts, failed_at
+            )
+            VALUES(?, ?, ?, ?, ?, ?, ?)
+            """,
+            [tuple(row) + (now,) for row in dead],
+        )
+        delete_entries(connection, [row["event_id"] for row in dead])
+    return rows, dead
+
+
+def delete_entries(connection, event_ids):
+    connection.executemany(
+        "DELETE FROM leaderboard_outbox WHERE event_id=?",
+        [(event_id,) for event_id in event_ids],
+    )
+
+
+# An outbox row as the leaderboard's Entry
+def entry(row):
+    return {
+        "game_id": str(uuid.UUID(bytes=row["uuid"])),
+        "username": row["username"],
+        "is_win": bool(row["is_win"]),
+        "number_of_guesses": row["number_of_guesses"],
+    }
+
+
+# POST a batch to the leaderboard service. urllib blocks, so it runs on the
+# default executor.
+async def post_entries(url, entries, timeout=10):
+    def post():
+        request = urllib.request.Request(
+            url,
+            data=json.dumps({"entries": entries}).encode(),
+            headers={"Content-Type": "application/json"},
+        )
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+
+    await asyncio.get_running_loop().run_in_executor(None, post)
+
+
+# Ships queued entries to the leaderboard in batches. Every game worker runs
+# one; claims keep them from sending the same entries at once. Delivery is
+# at least once: an entry is deleted only after its batch is acknowledged,
+# and the leaderboard keys scores by game_id, so a resent entry replaces its
+# score instead of counting twice. An entry that is never acknowledged (one
+# the leaderboard keeps rejecting, say) is given up on after `max_attempts`
+# claims, so it does not hold up the rest. `send` is an async callable
+# taking a list of entries.
+class OutboxDrainer:
+    def __init__(
+        self, db, send, batch=500, interval=1.0, lease=30.0, max_attempts=10, logger=None
+    ):
+        self.db = db
+        self.send = send
+        self.batch = batch
+        self.interval = interval
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.logger = logger
+        # sent entries, batches, failed batches and dead entries
+        self.counts = collections.Counter()
+        self._task = None
+
+    # Send one batch; returns how many entries were sent
+    async def drain_once(self):
+        rows, dead = await self.db.transaction(
+            claim_entries, self.batch, self.lease, self.max_attempts
+        )
+        if dead:
+            self.counts["dead"] += len(dead)
+            if self.logger is not None:
+                self.logger.error(
+                    "Gave up on leaderboard entries %s after %d attempts, "
+                    "moved to leaderboard_outbox_dead",
+                    [row["event_id"] for row in dead],
+                    self.max_attempts,
+                )
+        if not rows:
+            return 0
+        try:
+            await self.send([entry(row) for row in rows])
+        except Exception:
+            # Left claimed: retried by any worker once the claim expires
+            self.counts["failed"] += 1
+            if self.logger is not None:
+                self.logger.exception("Could not send %d leaderboard entries", len(rows))
+            return 0
+        await self.db.transaction(delete_entries, [row["event_id"] for row in rows])
+        self.counts["sent"] += len(rows)
+        self.counts["batches"] += 1
+        return len(rows)
+
+    # Full batches go out back to back; otherwise wait for more to queue up
+    async def _drain_forever(self):
+        while True:
+            try:
+                sent = await self.drain_once()
+            except sqlite3.Error:
+                sent = 0
+                if self.logger is not None:
+                    self.logger.exception("Could not read the leaderboard outbox")
+            if sent < self.batch:
+                await asyncio.sleep(self.interval)
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._drain_forever())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,293 @@
+# Imports
+import asyncio
+import collections
+import concurrent.futures
+import contextlib
+import sqlite3
+import time
+import databases
+from metrics import Metrics
+
+
+# A single long-lived SQLite connection. Every call runs on the connection's
+# own thread, so statements reuse its prepared statement cache across requests.
+class PooledConnection:
+    def __init__(self, path, statement_cache):
+        self._path = path
+        self._statement_cache = statement_cache
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self._connection = None
+
+    async def _call(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    def _open(self):
+        connection = sqlite3.connect(
+            self._path,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=self._statement_cache,
+        )
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    async def open(self):
+        self._connection = await self._call(self._open)
+
+    async def close(self):
+        await self._call(self._connection.close)
+        self._executor.shutdown()
+
+    # Run fn(connection, *args) on the connection thread in a single hop
+    async def run(self, fn, *args):
+        return await self._call(fn, self._connection, *args)
+
+
+# Fixed-size pool of connections to one database URL, opened at startup and
+# closed at shutdown. Mirrors the query API of databases.Database. With
+# metrics, records connection setup, the wait for an idle connection and
+# query time, each tagged with the URL. Streamed reads get connections of
+# their own, at most `streams` at a time.
+class Pool:
+    def __init__(self, url, size=4, statement_cache=128, metrics=None, streams=4):
+        self.url = url
+        self.size = size
+        self.streams = streams
+        self._streams = None
+        self._path = databases.DatabaseURL(url).database
+        self._statement_cache = statement_cache
+        self._connections = []
+        self._idle = None
+        metrics = metrics or Metrics()
+        self._connect_seconds = metrics.histogram(
+            "wordle_db_connect_seconds", "Time to open a database connection"
+        )
+        self._wait_seconds = metrics.histogram(
+            "wordle_db_pool_wait_seconds", "Time waiting for an idle pooled connection"
+        )
+        self._query_seconds = metrics.histogram(
+            "wordle_db_query_seconds", "Time running a query or transaction, by operation"
+        )
+
+    async def connect(self):
+        self._idle = asyncio.Queue()
+        self._streams = asyncio.Semaphore(self.streams)
+        for _ in range(self.size):
+            connection = PooledConnection(self._path, self._statement_cache)
+            with self._connect_seconds.time(url=self.url):
+                await connection.open()
+            self._connections.append(connection)
+            self._idle.put_nowait(connection)
+
+    async def disconnect(self):
+        for connection in self._connections:
+            await connection.close()
+        self._connections = []
+        self._idle = None
+
+    @contextlib.asynccontextmanager
+    async def connection(self):
+        connection = await self._idle.get()
+        try:
+            yield connection
+        finally:
+            self._idle.put_nowait(connection)
+
+    async def run(self, fn, *args):
+        return await self._run(fn.__name__, fn, *args)
+
+    async def _run(self, operation, fn, *args):
+        start = time.perf_counter()
+        async with self.connection() as connection:
+            self._wait_seconds.observe(time.perf_counter() - start, url=self.url)
+            with self._query_seconds.time(url=self.url, operation=operation):
+                return await connection.run(fn, *args)
+
+    async def fetch_one(self, query, values=None):
+        return await self._run("fetch_one", _fetch_one, query, values)
+
+    async def fetch_all(self, query, values=None):
+        return await self._run("fetch_all", _fetch_all, query, values)
+
+    async def execute(self, query, values=None):
+        return await self._run("execute", _execute, query, values)
+
+    # Whether every stream is taken, so another would have to wait
+    def streams_full(self):
+        return self._streams.locked()
+
+    # Yield the rows of each (query, values) in turn as they are read, `batch`
+    # rows per hop to the connection thread, without building the whole
+    # result. Runs on a connection opened for the stream, not a pooled one, so
+    # however slowly the client reads, it holds no pooled connection. The
+    # connection is closed when the iteration finishes or is closed.
+    async def iterate(self, queries, batch=500):
+        async with self._streams:
+            connection = PooledConnection(self._path, self._statement_cache)
+            with self._connect_seconds.time(url=self.url):
+                await connection.open()
+            try:
+                for query, values in queries:
+                    cursor = await connection.run(_execute_cursor, query, values)
+                    try:
+                        while True:
+                            rows = await connection.run(_fetch_many, cursor, batch)
+                            if not rows:
+                                break
+                            for row in rows:
+                                yield row
+                    finally:
+                        await connection.run(_close_cursor, cursor)
+            finally:
+                await connection.close()
+
+    # Run fn(connection, *args) inside BEGIN IMMEDIATE ... COMMIT, rolling
+    # back if it raises. The write lock is taken up front, so reads made by
+    # fn cannot go stale before its writes land.
+    async def transaction(self, fn, *args):
+        return await self._run(fn.__name__, _transaction, fn, *args)
+
+
+# Coalesces concurrent write transactions on one pool into shared commits.
+# transaction(fn, *args) queues fn; queued functions are applied in order,
+# up to `batch` of them in one BEGIN IMMEDIATE ... COMMIT, each under its own
+# savepoint. A function that raises is rolled back alone and its caller gets
+# the exception; the others still commit and get their own results. One
+# batch is in flight at a time. Whatever queues while it commits goes in the
+# next one, which first waits up to `window` seconds to fill; a write that
+# finds nothing committing is not held back.
+class GroupCommit:
+    def __init__(self, pool, batch=64, window=0.001):
+        self.pool = pool
+        self.batch = batch
+        self.window = window
+        # committed batches, and operations that committed or were rolled back
+        self.counts = collections.Counter()
+        self._queue = []
+        self._full = asyncio.Event()
+        self._task = None
+
+    async def transaction(self, fn, *args):
+        future = asyncio.get_running_loop().create_future()
+        self._queue.append((fn, args, future))
+        if len(self._queue) >= self.batch:
+            self._full.set()
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._commit_queued())
+        return await future
+
+    async def _commit_queued(self):
+        # A write arriving when nothing is committing goes straight out
+        wait = False
+        try:
+            while self._queue:
+                if wait and len(self._queue) < self.batch and self.window > 0:
+                    try:
+                        await asyncio.wait_for(self._full.wait(), self.window)
+                    except asyncio.TimeoutError:
+                        pass
+                queued, self._queue = self._queue[: self.batch], self._queue[self.batch :]
+                if len(self._queue) < self.batch:
+                    self._full.clear()
+                await self._commit(queued)
+                wait = True
+        finally:
+            self._task = None
+
+    async def _commit(self, queued):
+        try:
+            results = await self.pool._run(
+                "group_commit", _group_commit, [(fn, args) for fn, args, _ in queued]
+            )
+        except BaseException as e:
+            # Nothing in the batch committed
+            self.counts["failed"] += len(queued)
+            for _, _, future in queued:
+                if future.done():
+                    continue
+                if isinstance(e, Exception):
+                    future.set_exception(e)
+                else:
+                    future.cancel()
+            if not isinstance(e, Exception):
+                raise
+            return
+        self.counts["batches"] += 1
+        for (_, _, future), (error, result) in zip(queued, results):
+            self.counts["rolled_back" if error else "committed"] += 1
+            if future.done():
+                continue
+            if error:
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    # Wait for queued transactions to commit
+    async def stop(self):
+        if self._task is not None:
+            await asyncio.shield(self._task)
+
+
+def _fetch_one(connection, query, values):
+    return connection.execute(query, values or {}).fetchone()
+
+
+def _fetch_all(connection, query, values):
+    return connection.execute(query, values or {}).fetchall()
+
+
+def _execute(connection, query, values):
+    return connection.execute(query, values or {}).lastrowid
+
+
+def _execute_cursor(connection, query, values):
+    return connection.execute(query, values or {})
+
+
+def _fetch_many(connection, cursor, batch):
+    return cursor.fetchmany(batch)
+
+
+def _close_cursor(connection, cursor):
+    cursor.close()
+
+
+def _transaction(connection, fn, *args):
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        result = fn(connection, *args)
+        connection.execute("COMMIT")
+    except BaseException:
+        _rollback(connection)
+        raise
+    return result
+
+
+# Roll back whatever is left open, including after a failed COMMIT (e.g.
+# SQLITE_BUSY while readers hold the database), so a pooled connection never
+# keeps the write lock. SQLite may already have rolled back on its own.
+def _rollback(connection):
+    if connection.in_transaction:
+        connection.execute("ROLLBACK")
+
+
+# Apply each (fn, args) under a savepoint in one transaction, returning an
+# (error, result or exception) pair per function
+def _group_commit(connection, operations):
+    results = []
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        for fn, args in operations:
+            connection.execute("SAVEPOINT operation")
+            try:
+                results.append((False, fn(connection, *args)))
+            except Exception as e:
+                connection.execute("ROLLBACK TO operation")
+                results.append((True, e))
+            connection.execute("RELEASE operation")
+        connection.execute("COMMIT")
+    except BaseException:
+        _rollback(connection)
+        raise
+    return results
@@ -0,0 +1,214 @@
+# Imports
+import asyncio
+import collections
+import random
+import sqlite3
+import time
+
+# Token carried by clients between a write and their next reads
+POSITION_HEADER = "X-Replication-Position"
+POSITION_COOKIE = "replication_position"
+
+
+# Advance the primary's replication position and return the new value. Call
+# it inside every write transaction, so the position replicates with the write.
+def bump_position(connection):
+    connection.execute("UPDATE replication_position SET position = position + 1")
+    return connection.execute("SELECT position FROM replication_position").fetchone()[0]
+
+
+# One database in the read pool. Wraps its Pool with the same query API and
+# keeps an EWMA of query latency and error rate, plus its replication lag.
+class Replica:
+    def __init__(self, db, weight=1.0, alpha=0.2):
+        self.db = db
+        self.url = db.url
+        self.weight = weight
+        self.alpha = alpha
+        self.latency = None
+        self.error_rate = 0.0
+        self.failures = 0
+        self.position = 0
+        self.lag = 0
+        self.healthy = True
+        self.picks = 0
+
+    def observe(self, elapsed):
+        ok = elapsed is not None
+        self.error_rate += self.alpha * ((0.0 if ok else 1.0) - self.error_rate)
+        if ok:
+            self.failures = 0
+            if self.latency is None:
+                self.latency = elapsed
+            else:
+                self.latency += self.alpha * (elapsed - self.latency)
+        else:
+            self.failures += 1
+
+    # Lower is better: latency, inflated by errors and divided by weight
+    def cost(self):
+        return (self.latency or 0.0) * (1 + 10 * self.error_rate) / self.weight
+
+    async def _timed(self, awaitable):
+        start = time.perf_counter()
+        try:
+            result = await awaitable
+        except sqlite3.Error:
+            self.observe(None)
+            raise
+        self.observe(time.perf_counter() - start)
+        return result
+
+    def fetch_one(self, query, values=None):
+        return self._timed(self.db.fetch_one(query, values))
+
+    def fetch_all(self, query, values=None):
+        return self._timed(self.db.fetch_all(query, values))
+
+    def run(self, fn, *args):
+        return self._timed(self.db.run(fn, *args))
+
+    # Streamed reads are not timed: their duration depends on the client
+    def iterate(self, queries, batch=500):
+        return self.db.iterate(queries, batch)
+
+    def streams_full(self):
+        return self.db.streams_full()
+
+    async def refresh_position(self):
+        row = await self.fetch_one("SELECT position FROM replication_position")
+        self.position = max(self.position, row["position"])
+        return self.position
+
+    def stats(self):
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "weight": self.weight,
+            "latency_ms": None if self.latency is None else self.latency * 1000,
+            "error_rate": self.error_rate,
+            "position": self.position,
+            "lag": self.lag,
+            "picks": self.picks,
+        }
+
+
+# Read routing for the game service. Reads go to the cheaper of two random
+# healthy replicas (power of two choices). Reads that carry a replication
+# position (read-your-writes) only go to a replica that has applied it;
+# otherwise they wait briefly for one to catch up, then use the primary.
+# A background task health-checks every replica and takes it out of the
+# pool while it is failing or lagging, and back in once it recovers.
+class ReplicaSet:
+    def __init__(
+        self,
+        primary,
+        replicas,
+        wait=0.05,
+        poll=0.005,
+        interval=1.0,
+        max_lag=100,
+        max_failures=3,
+    ):
+        self.primary = primary
+        self.replicas = replicas
+        self.wait = wait
+        self.poll = poll
+        self.interval = interval
+        self.max_lag = max_lag
+        self.max_failures = max_failures
+        # How many reads took each path: untracked, replica, waited, primary
+        self.routes = collections.Counter()
+        self._task = None
+
+    def _healthy(self):
+        return [replica for replica in self.replicas if replica.healthy]
+
+    def _pick(self, candidates):
+        if len(candidates) > 1:
+            candidates = random.sample(candidates, 2)
+        replica = min(candidates, key=Replica.cost)
+        replica.picks += 1
+        return replica
+
+    # Pick the database for a request's reads
+    async def choose(self, position=None):
+        if not position:
+            healthy = self._healthy()
+            if healthy:
+                self.routes["untracked"] += 1
+                return self._pick(healthy)
+            self.routes["primary"] += 1
+            return self.primary
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.wait
+        waited = False
+        while True:
+            healthy = self._healthy()
+            candidates = [r for r in healthy if r.position >= position]
+            if not candidates and healthy:
+                await asyncio.gather(
+                    *(r.refresh_position() for r in healthy), return_exceptions=True
+                )
+                candidates = [r for r in healthy if r.position >= position]
+            if candidates:
+                self.routes["waited" if waited else "replica"] += 1
+                return self._pick(candidates)
+            if not healthy or loop.time() >= deadline:
+                break
+            waited = True
+            await asyncio.sleep(self.poll)
+
+        self.routes["primary"] += 1
+        return self.primary
+
+    async def check(self):
+        try:
+            primary_position = await self.primary.refresh_position()
+        except sqlite3.Error:
+            primary_position = None
+
+        for replica in self.replicas:
+            try:
+                await replica.refresh_position()
+            except sqlite3.Error:
+                pass
+            if primary_position is not None:
+                replica.lag = max(0, primary_position - replica.position)
+            replica.healthy = (
+                replica.failures < self.max_failures and replica.lag <= self.max_lag
+            )
+
+    async def _check_forever(self):
+        while True:
+            await self.check()
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._check_forever())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self):
+        return {
+            "routes": dict(self.routes),
+            "primary": self.primary.stats(),
+            "replicas": [replica.stats() for replica in self.replicas],
+        }
+
+
+# The client's last write position, from the header or the session cookie
+def client_position(request):
+    value = request.headers.get(POSITION_HEADER) or request.cookies.get(POSITION_COOKIE)
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
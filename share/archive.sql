@@ -0,0 +1,19 @@
+-- Finished games moved out of games and guesses by ./bin/archive_games.py
+-- once they are older than [ARCHIVE] RETAIN_DAYS, so the live tables and
+-- their indexes only hold recent games. A game's stored guesses are packed
+-- into one blob (see archive.py). game_id and uuid are the game's own, so
+-- the API answers for an archived game as before. Safe to run on an existing
+-- game.db.
+CREATE TABLE IF NOT EXISTS archived_games (
+    game_id INTEGER PRIMARY KEY,
+    uuid BLOB NOT NULL UNIQUE,
+    username VARCHAR NOT NULL,
+    secret_word_id INTEGER NOT NULL,
+    state INTEGER NOT NULL,
+    guess_remaining INTEGER NOT NULL,
+    finished_at INTEGER,
+    finish_position INTEGER,
+    guesses BLOB NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS archived_games_idx_usernamestate ON archived_games(username, state);
@@ -4,27 +4,36 @@ DROP TABLE IF EXISTS guesses;
 DROP TABLE IF EXISTS games;
 
 -- state - 0 means game in progress, 1 means game finished and won the game, 2 means finished and lost the game
+-- game_id is the internal key; uuid is the 16-byte public identifier used in the API
+-- finished_at is when the game ended, in Unix seconds (NULL while in progress)
+-- finish_position is the replication position of the guess that ended it, so
+-- games finished in the same second still have an order
 CREATE TABLE games (
-    game_id VARCHAR PRIMARY KEY,
+    game_id INTEGER PRIMARY KEY,
+    uuid BLOB NOT NULL UNIQUE,
     username VARCHAR NOT NULL,
     secret_word_id INTEGER NOT NULL,
     state INTEGER DEFAULT 0,
     guess_remaining INTEGER DEFAULT 6,
+    finished_at INTEGER,
+    finish_position INTEGER,
     FOREIGN KEY(secret_word_id) REFERENCES correct_words(correct_word_id)
 );
 
+-- Clustered by game, so a game's history is one contiguous range
 CREATE TABLE guesses(
-    guess_id INTEGER PRIMARY KEY,
-    game_id VARCHAR NOT NULL,
-    valid_word_id INTEGER NULL,
+    game_id INTEGER NOT NULL,
     guess_number INTEGER NOT NULL,
+    valid_word_id INTEGER NULL,
+    -- base-3 feedback pattern code, see feedback.py
+    feedback INTEGER,
+    PRIMARY KEY(game_id, guess_number),
     FOREIGN KEY(game_id) REFERENCES games(game_id),
     FOREIGN KEY(valid_word_id) REFERENCES valid_words(valid_word_id)
-);
+) WITHOUT ROWID;
 
 CREATE INDEX games_idx_usernamestate ON games(username, state);
-CREATE INDEX valid_words_idx_validword ON valid_words(valid_word);
-CREATE INDEX guesses_idx_idnumber ON guesses(game_id, guess_number);
+CREATE INDEX IF NOT EXISTS valid_words_idx_validword ON valid_words(valid_word);
 
 COMMIT;
 
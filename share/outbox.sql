@@ -0,0 +1,29 @@
+-- Finished games waiting to be reported to the leaderboard service, written
+-- in the transaction that finishes the game. Game workers claim a batch by
+-- setting claimed_until, send it to /leaderboard/add/batch and delete it once
+-- it is acknowledged; a batch whose worker failed is claimed again when its
+-- claim expires. attempts counts the claims. Safe to run on an existing
+-- game.db, but one whose outbox has no attempts column needs
+-- ./bin/migrate_outbox.py instead.
+CREATE TABLE IF NOT EXISTS leaderboard_outbox (
+    event_id INTEGER PRIMARY KEY,
+    uuid BLOB NOT NULL,
+    username VARCHAR NOT NULL,
+    is_win INTEGER NOT NULL,
+    number_of_guesses INTEGER NOT NULL,
+    claimed_until REAL NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0
+);
+
+-- Entries given up on after [OUTBOX] MAX_ATTEMPTS claims without an
+-- acknowledgement, so they no longer hold up the entries behind them. Kept
+-- to be looked at, and queued again by moving them back.
+CREATE TABLE IF NOT EXISTS leaderboard_outbox_dead (
+    event_id INTEGER PRIMARY KEY,
+    uuid BLOB NOT NULL,
+    username VARCHAR NOT NULL,
+    is_win INTEGER NOT NULL,
+    number_of_guesses INTEGER NOT NULL,
+    attempts INTEGER NOT NULL,
+    failed_at REAL NOT NULL
+);
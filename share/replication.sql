@@ -0,0 +1,9 @@
+-- Replication position for read-your-writes: every write transaction on the
+-- primary increments it, and reads are routed to a replica that has applied
+-- the position returned to the client. Safe to run on an existing game.db.
+CREATE TABLE IF NOT EXISTS replication_position (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    position INTEGER NOT NULL
+);
+
+INSERT OR IGNORE INTO replication_position(id, position) VALUES(1, 0);
@@ -0,0 +1,18 @@
+-- Per-user statistics, kept up to date in the transactions that create and
+-- finish games, so GET /games/statistics is a primary key lookup.
+-- guesses_1 to guesses_6 count games won in that many guesses; streaks count
+-- consecutive wins. Rebuild from games with ./bin/rebuild_stats.py.
+CREATE TABLE IF NOT EXISTS user_stats (
+    username VARCHAR PRIMARY KEY,
+    in_progress INTEGER NOT NULL DEFAULT 0,
+    wins INTEGER NOT NULL DEFAULT 0,
+    losses INTEGER NOT NULL DEFAULT 0,
+    guesses_1 INTEGER NOT NULL DEFAULT 0,
+    guesses_2 INTEGER NOT NULL DEFAULT 0,
+    guesses_3 INTEGER NOT NULL DEFAULT 0,
+    guesses_4 INTEGER NOT NULL DEFAULT 0,
+    guesses_5 INTEGER NOT NULL DEFAULT 0,
+    guesses_6 INTEGER NOT NULL DEFAULT 0,
+    current_streak INTEGER NOT NULL DEFAULT 0,
+    max_streak INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
@@ -1,5 +1,6 @@
 DROP TABLE IF EXISTS correct_words;
 DROP TABLE IF EXISTS valid_words;
+DROP TABLE IF EXISTS word_lists;
 
 CREATE TABLE valid_words(
     valid_word_id INTEGER PRIMARY KEY,
@@ -9,4 +10,9 @@ CREATE TABLE valid_words(
 CREATE TABLE correct_words(
     correct_word_id INTEGER PRIMARY KEY,
     correct_word VARCHAR NOT NULL
-);
\ No newline at end of file
+);
+
+-- Checksum of the share/words.bin the tables were filled from
+CREATE TABLE word_lists(
+    checksum BLOB NOT NULL
+);
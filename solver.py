@@ -0,0 +1,116 @@
+# Imports
+import random
+import numpy as np
+import feedback
+
+
+# Candidate counting and hints over the precomputed feedback matrix built by
+# bin/build_feedback_matrix.py: matrix[correct_word_id, valid_word_id] is the
+# pattern code of that guess against that secret (column 0 unused). Row 0
+# marks the best opening guess with a 1, as it is the same for every game and
+# by far the most expensive to work out. The file is memory-mapped
+# read-only, so every worker shares one copy in the page cache and loading it
+# costs nothing up front. Hints cost milliseconds of NumPy, so callers on an
+# event loop run them in an executor.
+class Solver:
+    def __init__(self, matrix, word_list, sample=None):
+        self.matrix = matrix
+        self.word_list = word_list
+        # Above this many candidates, expected information is estimated on a
+        # sample of them, which bounds the cost of a hint
+        self.sample = sample
+        self._secrets = np.arange(1, matrix.shape[0])
+        # Guesses packed with their index, see _entropy()
+        self._columns = np.arange(matrix.shape[1], dtype=np.uint32) << 8
+        # valid_word_id of each correct word, to prefer guesses that can win
+        self._secret_guess_ids = np.array(
+            [word_list.valid_word_id(word_list.secret_word(i)) or 0 for i in self._secrets]
+        )
+        self._opening = None
+
+    @classmethod
+    def load(cls, path, word_list, sample=None):
+        matrix = np.load(path, mmap_mode="r")
+        solver = cls(matrix, word_list, sample)
+        solver.check()
+        solver._opening = solver._load_opening()
+        return solver
+
+    # The opening marked in row 0, with its information (one column, so
+    # cheap). Matrices built before it was marked get it worked out here,
+    # which takes a while: load in an executor.
+    def _load_opening(self):
+        marked = np.flatnonzero(self.matrix[0])
+        if len(marked) != 1:
+            return self.opening()
+        guess = int(marked[0])
+        counts = np.bincount(self.matrix[1:, guess], minlength=243)
+        counts = counts[counts > 0]
+        n = len(self._secrets)
+        return guess, float(np.log2(n) - (counts * np.log2(counts)).sum() / n)
+
+    # The exact best opening guess and its information
+    def opening(self):
+        return self._best_guess(self._secrets, exact=True)
+
+    # The matrix must have been built from the same word lists
+    def check(self, samples=32):
+        expected = (len(self.word_list.correct_words), len(self.word_list.valid_words))
+        if self.matrix.shape != expected:
+            raise ValueError(f"Feedback matrix is {self.matrix.shape}, expected {expected}")
+        for _ in range(samples):
+            secret_id = random.randrange(1, expected[0])
+            guess_id = random.randrange(1, expected[1])
+            code = feedback.pattern(
+                self.word_list.secret_word(secret_id), self.word_list.valid_word(guess_id)
+            )
+            if self.matrix[secret_id, guess_id] != code:
+                raise ValueError("Feedback matrix does not match the word lists")
+
+    # correct_word_ids of the secrets consistent with every (valid_word_id,
+    # feedback code) seen so far
+    def candidates(self, guesses):
+        secrets = self._secrets
+        for valid_word_id, code in guesses:
+            secrets = secrets[self.matrix[secrets, valid_word_id] == code]
+        return secrets
+
+    # The valid_word_id that splits `secrets` into the most even feedback
+    # groups (the highest expected information, in bits), and that
+    # information. Ties go to a guess that could itself be the secret. The
+    # opening guess is the same for every game, so it is worked out once.
+    def best_guess(self, secrets):
+        if len(secrets) == len(self._secrets):
+            if self._opening is None:
+                self._opening = self.opening()
+            return self._opening
+        return self._best_guess(secrets)
+
+    def _best_guess(self, secrets, exact=False):
+        if len(secrets) <= 2:
+            return int(self._secret_guess_ids[secrets[0] - 1]), float(len(secrets) == 2)
+        sample = secrets
+        if not exact and self.sample and len(secrets) > self.sample:
+            # Seeded by the candidates, so the same game state gets the same hint
+            rng = np.random.default_rng([len(secrets), int(secrets[0]), int(secrets[-1])])
+            sample = np.sort(rng.choice(secrets, self.sample, replace=False))
+        entropy = self._entropy(sample)
+        entropy[0] = -1.0
+        entropy[self._secret_guess_ids[secrets - 1]] += 1e-9
+        best = int(np.argmax(entropy))
+        return best, float(entropy[best])
+
+    # Expected information of every guess over `secrets`: entropy =
+    # log2(n) - sum(c * log2(c)) / n over the c secrets giving each code.
+    # Each (guess, code) is packed into one integer and sorted, so equal
+    # codes of a guess form a run of length c.
+    def _entropy(self, secrets):
+        keys = np.sort((self._columns | self.matrix[secrets]).ravel())
+        starts = np.ones(keys.size, dtype=bool)
+        starts[1:] = keys[1:] != keys[:-1]
+        positions = np.flatnonzero(starts)
+        runs = np.diff(np.append(positions, keys.size))
+        n = len(secrets)
+        return np.log2(n) - np.bincount(
+            keys[positions] >> 8, weights=runs * np.log2(runs), minlength=len(self._columns)
+        ) / n
@@ -8,18 +8,46 @@ import databases
 import toml
 import base64
 import hashlib
+import hmac
 import secrets
+import time
+import asyncio
+import collections
+import concurrent.futures
+from metrics import Metrics, instrument
 from quart import Quart, g, request, abort, jsonify
 from quart_schema import QuartSchema, RequestSchemaValidationError, validate_request, tag
 
 # Encryption type.
 ALGORITHM = "pbkdf2_sha256"
 
+# Response header naming the authenticated user, for nginx's auth_request
+AUTH_USER_HEADER = "X-Auth-User"
+
 # Initialize the app
 app = Quart(__name__)
 QuartSchema(app, tags=[{"name": "Users", "description": "APIs for creating a user and authenticating a user"} ])
 app.config.from_file(f"./etc/wordle.toml", toml.load)
 
+# Opt-in Prometheus metrics, served on /metrics when [METRICS] ENABLED
+metrics = Metrics(app.config["METRICS"]["ENABLED"])
+instrument(app, metrics)
+connect_seconds = metrics.histogram(
+    "wordle_db_connect_seconds", "Time to open a database connection"
+)
+query_seconds = metrics.histogram(
+    "wordle_db_query_seconds", "Time running a query or transaction, by operation"
+)
+hash_seconds = metrics.histogram(
+    "wordle_auth_hash_seconds", "Time to hash a password in the worker processes"
+)
+auth_checks = metrics.counter(
+    "wordle_auth_checks_total", "Credential checks by method and result"
+)
+
+# Worker processes for PBKDF2, started with the app
+hash_pool = None
+
 
 # Decorator to examine class and find fields
 @dataclasses.dataclass
@@ -28,12 +56,66 @@ class User:
     password: str
 
 
+# Bounded TTL cache of successful logins. Entries are keyed by an HMAC, under
+# a per-process random key, of the username, the password and the stored
+# password hash: no plaintext is kept, and changing a password changes the
+# stored hash, so entries for the old password can never match again.
+class CredentialCache:
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self._key = secrets.token_bytes(32)
+        self._entries = collections.OrderedDict()
+
+    def digest(self, username, password, password_hash):
+        message = "\0".join([username, password, password_hash]).encode("utf-8")
+        return hmac.new(self._key, message, hashlib.sha256).digest()
+
+    def __contains__(self, digest):
+        expires = self._entries.get(digest)
+        if expires is None:
+            return False
+        if expires < time.monotonic():
+            del self._entries[digest]
+            return False
+        self._entries.move_to_end(digest)
+        return True
+
+    def add(self, digest):
+        self._entries[digest] = time.monotonic() + self.ttl
+        self._entries.move_to_end(digest)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+
+credential_cache = CredentialCache(
+    app.config["AUTH"]["CACHE_SIZE"], app.config["AUTH"]["CACHE_TTL"]
+)
+
+
+# Start the PBKDF2 worker processes
+@app.before_serving
+async def start_hash_pool():
+    global hash_pool
+    hash_pool = concurrent.futures.ProcessPoolExecutor(
+        max_workers=app.config["AUTH"]["HASH_WORKERS"]
+    )
+
+
+# Stop the PBKDF2 worker processes on shutdown
+@app.after_serving
+async def stop_hash_pool():
+    hash_pool.shutdown()
+
+
 # Establish database connection
 async def _get_db():
     db = getattr(g, "_sqlite_db", None)
     if db is None:
-        db = g._sqlite_db = databases.Database(app.config["DATABASES"]["USER_URL"])
-        await db.connect()
+        url = app.config["DATABASES"]["USER_URL"]
+        db = g._sqlite_db = databases.Database(url)
+        with connect_seconds.time(url=url):
+            await db.connect()
     return db
 
 
@@ -53,16 +135,17 @@ async def create_user(data):
     db = await _get_db()
     user = dataclasses.asdict(data)
     # Encrypt password
-    user["password"] = hash_password(user["password"])
+    user["password"] = await hash_password_async(user["password"])
     # Insert into database
     try:
-        await db.execute(
-            """
-            INSERT INTO users(username, password) 
-            VALUES (:username, :password)
-            """,
-            values=user
-        )
+        with query_seconds.time(url=str(db.url), operation="create_user"):
+            await db.execute(
+                """
+                INSERT INTO users(username, password) 
+                VALUES (:username, :password)
+                """,
+                values=user
+            )
     # Error
     except sqlite3.IntegrityError as e:
         abort(409, e)
@@ -73,34 +156,103 @@ async def create_user(data):
 # Endpoint for /login, verifies credentials.
 @app.route("/login", methods=["GET"])
 async def login():
-    """ Authenticate the user """
-    db = await _get_db()
-    await check_user(db, request.authorization)
+    """ Authenticate the user, with Basic auth or a Bearer token. Pass ?token=true with Basic auth to also get a short-lived token to use instead of the password """
     success_response = {"authenticated": True}
-    return success_response, 200
+    token = bearer_token(request.headers.get("Authorization"))
+    if token is not None:
+        username = verify_token(token)
+        auth_checks.inc(method="token", result="fail" if username is None else "ok")
+        if username is None:
+            abort(401)
+        # A token is never renewed with a token, or it would never expire
+        if request.args.get("token") == "true":
+            abort(400, "Log in with your password to get a new token")
+    else:
+        db = await _get_db()
+        await check_user(db, request.authorization)
+        username = request.authorization.username
+        if request.args.get("token") == "true":
+            success_response["token"], success_response["expires"] = issue_token(username)
+
+    # nginx passes this on to the game service as the authenticated user
+    return success_response, 200, {AUTH_USER_HEADER: username}
 
 
 async def check_user(db, auth):
     if auth is not None and auth.type == 'basic':
-        user_info = await db.fetch_one(
-            """
-            SELECT password 
-            FROM users
-            WHERE username = :username
-            """,
-            values={"username": auth.username}
-        )
+        with query_seconds.time(url=str(db.url), operation="check_user"):
+            user_info = await db.fetch_one(
+                """
+                SELECT password 
+                FROM users
+                WHERE username = :username
+                """,
+                values={"username": auth.username}
+            )
         if user_info:
-            if verify_password(auth.password, user_info["password"]):
+            digest = credential_cache.digest(
+                auth.username, auth.password, user_info["password"]
+            )
+            if digest in credential_cache:
+                auth_checks.inc(method="basic", result="cached")
+                return True
+            if await verify_password(auth.password, user_info["password"]):
+                credential_cache.add(digest)
+                auth_checks.inc(method="basic", result="ok")
                 return True
             else:
+                auth_checks.inc(method="basic", result="fail")
                 abort(401)
         else:
+            auth_checks.inc(method="basic", result="unknown_user")
             abort(401)
     else:
         abort(401)
 
 
+# Short-lived signed token: <key id>.<username>.<expiry>.<signature>, with the
+# username base64url-encoded and an HMAC-SHA256 signature over the rest.
+# Checking one is pure CPU work, with no database access and no PBKDF2.
+def issue_token(username, now=None):
+    config = app.config["TOKENS"]
+    key_id = config["ACTIVE_KEY"]
+    expires = int(now or time.time()) + config["TTL"]
+    payload = "{}.{}.{}".format(key_id, _b64encode(username.encode("utf-8")), expires)
+    return "{}.{}".format(payload, _sign(key_id, payload)), expires
+
+
+# Username from a valid, unexpired token, or None. Tokens signed with any key
+# still listed in [TOKENS.KEYS] are accepted, so keys can be rotated by adding
+# a new key, making it ACTIVE_KEY, and removing the old one after TTL seconds.
+def verify_token(token, now=None):
+    try:
+        key_id, username, expires, signature = token.split(".")
+        expected = _sign(key_id, "{}.{}.{}".format(key_id, username, expires))
+        if not secrets.compare_digest(signature, expected):
+            return None
+        if int(expires) < (now or time.time()):
+            return None
+        return base64.urlsafe_b64decode(username + "=" * (-len(username) % 4)).decode("utf-8")
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def _sign(key_id, payload):
+    key = app.config["TOKENS"]["KEYS"][key_id].encode("utf-8")
+    return _b64encode(hmac.new(key, payload.encode("utf-8"), hashlib.sha256).digest())
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+
+def bearer_token(authorization):
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() == "bearer" and token:
+        return token.strip()
+    return None
+
+
 # Hash a given password using pbkdf2.
 def hash_password(password, salt=None, iterations=260000):
     if salt is None:
@@ -112,14 +264,23 @@ def hash_password(password, salt=None, iterations=260000):
     return "{}${}${}${}".format(ALGORITHM, iterations, salt, b64_hash)
 
 
+# Hash a password in a worker process, keeping the event loop responsive.
+async def hash_password_async(password, salt=None, iterations=260000):
+    loop = asyncio.get_running_loop()
+    with hash_seconds.time():
+        return await loop.run_in_executor(
+            hash_pool, hash_password, password, salt, iterations
+        )
+
+
 # Verify a password by comparing it to the hash.
-def verify_password(password, password_hash):
+async def verify_password(password, password_hash):
     if (password_hash or "").count("$") != 3:
         abort(401)
     algorithm, iterations, salt, b64_hash = password_hash.split("$", 3)
     iterations = int(iterations)
     assert algorithm == ALGORITHM
-    compare_hash = hash_password(password, salt, iterations)
+    compare_hash = await hash_password_async(password, salt, iterations)
     return secrets.compare_digest(password_hash, compare_hash)
 
 
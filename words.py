@@ -0,0 +1,184 @@
+# Imports
+import hashlib
+import mmap
+import random
+import sqlite3
+import struct
+import numpy as np
+
+# share/words.bin, written by bin/pack_words.py: a header, then four
+# sections of fixed-size records. The correct and valid words are in id
+# order (record i is word id i + 1, the ids the word tables use), followed by
+# the valid words sorted and the valid_word_id of each sorted word, so a word
+# is looked up by binary search. The checksum is the SHA-256 of everything
+# after the header.
+MAGIC = b"WRDL"
+VERSION = 1
+WORD_LENGTH = 5
+# magic, version, word length, correct count, valid count, checksum
+HEADER = struct.Struct("<4sBBxxII32s")
+ID = np.dtype("<u4")
+
+
+# Read-only view of a packed word list. The sections are NumPy arrays over
+# the mapped file, so nothing is parsed or copied when it is opened.
+class PackedWords:
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < HEADER.size:
+            raise ValueError(f"{path} is not a packed word list")
+        magic, version, length, correct, valid, self.checksum = HEADER.unpack_from(
+            self._map
+        )
+        if magic != MAGIC or version != VERSION or length != WORD_LENGTH:
+            raise ValueError(f"{path} is not a version {VERSION} packed word list")
+        body = memoryview(self._map)[HEADER.size :]
+        if len(body) != (2 * valid + correct) * WORD_LENGTH + valid * ID.itemsize:
+            raise ValueError(f"{path} is truncated")
+        if hashlib.sha256(body).digest() != self.checksum:
+            raise ValueError(f"{path} is corrupt: checksum mismatch")
+
+        word = np.dtype(f"S{WORD_LENGTH}")
+        offset = HEADER.size
+        sections = []
+        for dtype, count in [(word, correct), (word, valid), (word, valid), (ID, valid)]:
+            sections.append(np.frombuffer(self._map, dtype, count, offset))
+            offset += dtype.itemsize * count
+        self.correct, self.valid, self._sorted, self._sorted_ids = sections
+
+    # valid_word_id of a word, or None
+    def valid_word_id(self, word):
+        try:
+            key = word.encode("ascii")
+        except (AttributeError, UnicodeEncodeError):
+            return None
+        i = int(np.searchsorted(self._sorted, key))
+        if i < len(self._sorted) and self._sorted[i] == key:
+            return int(self._sorted_ids[i])
+        return None
+
+
+# Write a packed word list. `correct` and `valid` are in id order.
+def pack(correct, valid):
+    correct_records = np.array(correct, dtype=f"S{WORD_LENGTH}")
+    valid_records = np.array(valid, dtype=f"S{WORD_LENGTH}")
+    if any(len(word) != WORD_LENGTH for word in [*correct, *valid]):
+        raise ValueError(f"Words must be {WORD_LENGTH} ASCII letters")
+    order = np.argsort(valid_records, kind="stable")
+    body = b"".join(
+        [
+            correct_records.tobytes(),
+            valid_records.tobytes(),
+            valid_records[order].tobytes(),
+            (order + 1).astype(ID).tobytes(),
+        ]
+    )
+    checksum = hashlib.sha256(body).digest()
+    return HEADER.pack(MAGIC, VERSION, WORD_LENGTH, len(correct), len(valid), checksum) + body
+
+
+# Word ids -> words over a packed section, indexed by id like the lists
+# built from the tables (id 0 is None)
+class _Records:
+    def __init__(self, records):
+        self._records = records
+
+    def __len__(self):
+        return len(self._records) + 1
+
+    def __getitem__(self, word_id):
+        if word_id < 1:
+            return None
+        return self._records[word_id - 1].decode("ascii")
+
+
+# The valid_ids mapping over a packed word list
+class _SortedIndex:
+    def __init__(self, packed):
+        self._packed = packed
+
+    def get(self, word):
+        return self._packed.valid_word_id(word)
+
+
+# In-memory copy of the static valid_words and correct_words tables. Ids are
+# the tables' primary keys, so the lists are indexed directly by id.
+class WordList:
+    def __init__(self):
+        self.valid_ids = {}
+        self.valid_words = []
+        self.correct_words = []
+        self._correct_ids = []
+        # "packed" or "tables", once loaded
+        self.source = None
+
+    # (Re)load the words. The packed file is used if the database was filled
+    # from that same file (bin/word_init.py records its checksum); otherwise
+    # both tables are read. The new structures are built first and swapped in
+    # without awaiting, so requests never see a half-loaded list.
+    async def load(self, db, path=None):
+        packed = await _matching_packed(db, path) if path else None
+        if packed is not None:
+            self.valid_ids = _SortedIndex(packed)
+            self.valid_words = _Records(packed.valid)
+            self.correct_words = _Records(packed.correct)
+            self._correct_ids = range(1, len(packed.correct) + 1)
+            self.source = "packed"
+            return len(packed.valid) + len(packed.correct)
+
+        valid_rows = await db.fetch_all(
+            """
+            SELECT valid_word_id, valid_word FROM valid_words
+            """
+        )
+        correct_rows = await db.fetch_all(
+            """
+            SELECT correct_word_id, correct_word FROM correct_words
+            """
+        )
+
+        valid_ids = {word: word_id for word_id, word in valid_rows}
+        valid_words = _by_id(valid_rows)
+        correct_words = _by_id(correct_rows)
+
+        self.valid_ids = valid_ids
+        self.valid_words = valid_words
+        self.correct_words = correct_words
+        self._correct_ids = [word_id for word_id, _ in correct_rows]
+        self.source = "tables"
+        return len(valid_rows) + len(correct_rows)
+
+    # valid_word_id for a guess, or None if it is not a valid word
+    def valid_word_id(self, word):
+        return self.valid_ids.get(word)
+
+    def valid_word(self, valid_word_id):
+        return self.valid_words[valid_word_id]
+
+    def secret_word(self, correct_word_id):
+        return self.correct_words[correct_word_id]
+
+    def random_secret_id(self):
+        return random.choice(self._correct_ids)
+
+
+# The packed word list at `path` if it is intact and the one the database
+# was filled from, else None
+async def _matching_packed(db, path):
+    try:
+        packed = PackedWords(path)
+        row = await db.fetch_one("SELECT checksum FROM word_lists")
+    except (OSError, ValueError, sqlite3.OperationalError):
+        return None
+    if row is None or row["checksum"] != packed.checksum:
+        return None
+    return packed
+
+
+# Build an id -> word list from (id, word) rows
+def _by_id(rows):
+    words = [None] * (max((word_id for word_id, _ in rows), default=0) + 1)
+    for word_id, word in rows:
+        words[word_id] = word
+    return words